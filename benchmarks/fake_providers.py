@@ -0,0 +1,248 @@
+"""Local stand-ins for the OpenAI, Groq and weather APIs, for load tests that cost no API credits.
+
+Usage (from the project root):
+    python -m benchmarks.fake_providers --chat-latency-ms 400 --error-rate 0.01
+
+Then point the app at them:
+    OPENAI_BASE_URL=http://127.0.0.1:8801/v1
+    GROQ_BASE_URL=http://127.0.0.1:8802
+    WEATHER_API_URL=http://127.0.0.1:8803/v1/current.xml
+
+Latencies are log-normal around the given median. Each server reports per-operation
+call counts, errors and latency at GET /_stats (POST /_reset clears them).
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import re
+import time
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from benchmarks.pdfgen import DISHES, INGREDIENTS
+
+WEATHER_WORDS = re.compile(r"\b(weather|forecast|rain|snow|sunny|temperature|wind|umbrella|cold|hot|humid)\b", re.I)
+FOOD_WORDS = re.compile(
+    r"\b(food|eat|cook|make|recipes?|dish(es)?|dinner|lunch|breakfast|ingredients?|sauce|soup|taste|meal|serv(e|ed|ing)|"
+    + "|".join(re.escape(word) for word in DISHES + INGREDIENTS) + r")\b",
+    re.I
+)
+
+class ProviderProfile:
+    """Latency distribution, error rate and streaming pace of one fake provider"""
+
+    def __init__(self, median_ms: float, sigma: float = 0.5, error_rate: float = 0.0,
+                 token_delay_ms: float = 15, tokens: int = 60):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.token_delay_ms = token_delay_ms
+        self.tokens = tokens
+
+    def latency(self) -> float:
+        return random.lognormvariate(0, self.sigma) * self.median_ms / 1000
+
+    def fails(self) -> bool:
+        return random.random() < self.error_rate
+
+class ProviderStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.operations = {}
+
+    def record(self, operation: str, seconds: float, error: bool = False):
+        entry = self.operations.setdefault(operation, {"calls": 0, "errors": 0, "seconds": 0.0})
+        entry["calls"] += 1
+        entry["errors"] += int(error)
+        entry["seconds"] += seconds
+
+    def summary(self):
+        return {
+            operation: {**entry, "mean_ms": 1000 * entry["seconds"] / entry["calls"] if entry["calls"] else 0.0}
+            for operation, entry in self.operations.items()
+        }
+
+def _error_response(status_code: int = 503):
+    headers = {"Retry-After": "1"} if status_code == 429 else {}
+    body = {"error": {"message": "Injected failure", "type": "server_error", "code": status_code}}
+    return JSONResponse(body, status_code=status_code, headers=headers)
+
+def _answer_words(count: int):
+    words = "the dish uses fresh ingredients simmered slowly with herbs and a little salt".split()
+    return [words[i % len(words)] for i in range(count)]
+
+def _classify(text: str) -> str:
+    if WEATHER_WORDS.search(text):
+        return "weather"
+    if FOOD_WORDS.search(text):
+        return "food"
+    return "other"
+
+def _classify_numbered(text: str) -> str:
+    """Answer a packed classification prompt ("1. message" per line) with a JSON object of labels"""
+    labels = {}
+    for line in text.splitlines():
+        number, _, message = line.partition(". ")
+        if number.strip().isdigit():
+            labels[number.strip()] = _classify(message)
+    return json.dumps(labels)
+
+def _embedding(text: str, dimensions: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+def _completion(content: str, model: str):
+    return {
+        "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+    }
+
+def _stream(words, model: str, delay: float):
+    async def events():
+        for word in words:
+            chunk = {
+                "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(delay)
+        yield "data: [DONE]\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+def create_app(kind: str, profile: ProviderProfile, embedding_profile: ProviderProfile = None) -> FastAPI:
+    """Fake provider app; kind is 'openai', 'groq' or 'weather'"""
+    app = FastAPI()
+    stats = ProviderStats()
+    embedding_profile = embedding_profile or profile
+
+    async def chat(request: Request, prefix: str):
+        body = await request.json()
+        system = body["messages"][0]["content"] if body["messages"][0]["role"] == "system" else ""
+        user = body["messages"][-1]["content"]
+        if "numbered" in system:
+            operation = f"{prefix}.classify_batch"
+        else:
+            operation = f"{prefix}.classify" if "Classify" in system else f"{prefix}.chat"
+        delay = profile.latency()
+        await asyncio.sleep(delay)
+        if profile.fails():
+            stats.record(operation, delay, error=True)
+            return _error_response(random.choice((429, 503)))
+        stats.record(operation, delay)
+        if operation.endswith("classify"):
+            return _completion(_classify(user), body["model"])
+        if operation.endswith("classify_batch"):
+            return _completion(_classify_numbered(user), body["model"])
+        words = _answer_words(profile.tokens)
+        if body.get("stream"):
+            return _stream(words, body["model"], profile.token_delay_ms / 1000)
+        return _completion(" ".join(words), body["model"])
+
+    if kind == "openai":
+        @app.post("/v1/chat/completions")
+        async def openai_chat(request: Request):
+            return await chat(request, "openai")
+
+        @app.post("/v1/embeddings")
+        async def embeddings(request: Request):
+            body = await request.json()
+            texts = [body["input"]] if isinstance(body["input"], str) else body["input"]
+            # Embedding latency grows a little with batch size, like the real API
+            delay = embedding_profile.latency() * (1 + len(texts) / 100)
+            await asyncio.sleep(delay)
+            if embedding_profile.fails():
+                stats.record("openai.embeddings", delay, error=True)
+                return _error_response(random.choice((429, 503)))
+            stats.record("openai.embeddings", delay)
+            dimensions = body.get("dimensions") or 1536
+            data = []
+            for index, text in enumerate(texts):
+                vector = _embedding(text, dimensions)
+                if body.get("encoding_format") == "base64":
+                    embedding = base64.b64encode(vector.tobytes()).decode()
+                else:
+                    embedding = vector.tolist()
+                data.append({"object": "embedding", "index": index, "embedding": embedding})
+            return {"object": "list", "model": body["model"], "data": data,
+                    "usage": {"prompt_tokens": len(texts), "total_tokens": len(texts)}}
+
+    elif kind == "groq":
+        @app.post("/openai/v1/chat/completions")
+        async def groq_chat(request: Request):
+            return await chat(request, "groq")
+
+    elif kind == "weather":
+        @app.get("/v1/current.xml")
+        async def current_weather(q: str = "New York"):
+            delay = profile.latency()
+            await asyncio.sleep(delay)
+            if profile.fails():
+                stats.record("weather.current", delay, error=True)
+                return _error_response(503)
+            stats.record("weather.current", delay)
+            xml = (
+                "<root><current><temp_c>21.0</temp_c><temp_f>69.8</temp_f>"
+                "<condition><text>Partly cloudy</text></condition>"
+                "<humidity>55</humidity><wind_kph>12.2</wind_kph></current></root>"
+            )
+            return Response(xml, media_type="application/xml")
+
+    @app.get("/_stats")
+    async def get_stats():
+        return stats.summary()
+
+    @app.post("/_reset")
+    async def reset_stats():
+        stats.reset()
+        return {"status": "reset"}
+
+    return app
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--openai-port", type=int, default=8801)
+    parser.add_argument("--groq-port", type=int, default=8802)
+    parser.add_argument("--weather-port", type=int, default=8803)
+    parser.add_argument("--chat-latency-ms", type=float, default=400, help="median chat completion latency")
+    parser.add_argument("--embedding-latency-ms", type=float, default=80, help="median embedding latency")
+    parser.add_argument("--weather-latency-ms", type=float, default=150, help="median weather API latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="log-normal spread (0 = fixed latency)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with 429/503")
+    parser.add_argument("--token-delay-ms", type=float, default=15, help="delay between streamed tokens")
+    parser.add_argument("--tokens", type=int, default=60, help="words per generated answer")
+
+def serve(args):
+    """Run the three fake providers in this process until interrupted"""
+    chat = dict(sigma=args.latency_sigma, error_rate=args.error_rate,
+                token_delay_ms=args.token_delay_ms, tokens=args.tokens)
+    embedding = ProviderProfile(args.embedding_latency_ms, args.latency_sigma, args.error_rate)
+    apps = [
+        (create_app("openai", ProviderProfile(args.chat_latency_ms, **chat), embedding), args.openai_port),
+        (create_app("groq", ProviderProfile(args.chat_latency_ms, **chat)), args.groq_port),
+        (create_app("weather", ProviderProfile(args.weather_latency_ms, args.latency_sigma, args.error_rate)),
+         args.weather_port),
+    ]
+    servers = [
+        uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        for app, port in apps
+    ]
+
+    async def run():
+        await asyncio.gather(*(server.serve() for server in servers))
+
+    asyncio.run(run())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_profile_arguments(parser)
+    serve(parser.parse_args())
+
+if __name__ == "__main__":
+    main()
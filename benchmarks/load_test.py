@@ -0,0 +1,413 @@
+"""Offline load test: runs the app against local fake providers and reports latency and throughput.
+
+Usage (from the project root):
+    python -m benchmarks.load_test --concurrency 1,8,32 --requests 200 --pdf-pages 20,200
+    python -m benchmarks.load_test --stream --error-rate 0.02 --json results.json
+    python -m benchmarks.load_test --json new.json --compare baseline.json
+
+Each run starts benchmarks.fake_providers and the app (uvicorn main:app) as
+subprocesses with their data in a temporary directory. For every PDF size,
+it ingests a generated document through /documents/ and times the job's
+stages. It then sends a food/weather/other message mix to /messages/ (and
+/messages/stream with --stream) at each concurrency level.
+
+The per-stage breakdown comes from the fake providers. It shows upstream
+calls per request and their mean latency, plus time to first token for
+streaming. Pass app settings through with --app-env KEY=VALUE (repeatable)
+to compare configurations.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+import httpx
+from benchmarks.fake_providers import add_profile_arguments
+from benchmarks.pdfgen import write_pdf
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROMPTS = {
+    "food": [
+        "How do I make kalua pork?",
+        "What goes into lomi salmon?",
+        "Which dishes use taro?",
+        "How long should haupia rest before serving?",
+        "What can I cook with coconut milk and ginger?",
+        "What is traditionally served with chicken long rice?",
+        "How should I store leftover loco moco?",
+        "Which recipe calls for macadamia nuts?",
+    ],
+    "weather": [
+        "What's the weather like today?",
+        "Will it rain this afternoon?",
+        "Do I need an umbrella tonight?",
+        "How windy is it right now?",
+    ],
+    "other": [
+        "Tell me a joke about programmers",
+        "Who won the football match yesterday?",
+        "Translate good morning into French",
+    ],
+}
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile (0 for an empty list)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))]
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for item in value.split(","):
+        category, weight = item.split("=")
+        mix[category.strip()] = float(weight)
+    return mix
+
+class Process:
+    """A benchmark subprocess with its output captured to a log file"""
+
+    def __init__(self, name: str, argv: List[str], env: Dict[str, str], workdir: str):
+        self.name = name
+        self.log_path = os.path.join(workdir, f"{name}.log")
+        self.log = open(self.log_path, "w")
+        self.started = time.perf_counter()
+        self.proc = subprocess.Popen(argv, env=env, cwd=PROJECT_ROOT, stdout=self.log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, url: str, timeout: float = 120) -> float:
+        """Poll url until it answers; returns seconds since the process was started"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"{self.name} exited with {self.proc.returncode}, see {self.log_path}")
+            try:
+                if httpx.get(url, timeout=1).status_code < 500:
+                    return time.perf_counter() - self.started
+            except httpx.TransportError:
+                pass
+            time.sleep(0.1)
+        raise RuntimeError(f"{self.name} did not become ready in {timeout}s, see {self.log_path}")
+
+    def stop(self):
+        if self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.log.close()
+
+class Harness:
+    def __init__(self, args, workdir: str):
+        self.args = args
+        self.workdir = workdir
+        self.ports = {"openai": free_port(), "groq": free_port(), "weather": free_port()}
+        self.providers = None
+
+    def provider_url(self, name: str) -> str:
+        return f"http://127.0.0.1:{self.ports[name]}"
+
+    def start_providers(self):
+        argv = [sys.executable, "-m", "benchmarks.fake_providers",
+                "--openai-port", str(self.ports["openai"]), "--groq-port", str(self.ports["groq"]),
+                "--weather-port", str(self.ports["weather"])]
+        for option in ("chat_latency_ms", "embedding_latency_ms", "weather_latency_ms", "latency_sigma",
+                       "error_rate", "token_delay_ms", "tokens"):
+            argv += ["--" + option.replace("_", "-"), str(getattr(self.args, option))]
+        self.providers = Process("providers", argv, dict(os.environ), self.workdir)
+        for name in self.ports:
+            self.providers.wait_ready(self.provider_url(name) + "/_stats")
+
+    def app_env(self, pdf_path: str) -> Dict[str, str]:
+        env = dict(os.environ)
+        env.update({
+            "OPENAI_API_KEY": "sk-benchmark",
+            "OPENAI_BASE_URL": self.provider_url("openai") + "/v1",
+            "OPENAI_CHAT_MODEL": "gpt-4o",
+            "OPENAI_EMBEDDING_MODEL": "text-embedding-3-small",
+            "GROQ_API_KEY": "gsk-benchmark",
+            "GROQ_BASE_URL": self.provider_url("groq"),
+            "GROQ_CHAT_MODEL": "llama-3.1-70b-versatile",
+            "WEATHER_API_KEY": "benchmark",
+            "WEATHER_API_URL": self.provider_url("weather") + "/v1/current.xml",
+            "WEATHER_LOCATION": "New York",
+            "CHROMA_DB_PATH": os.path.join(self.workdir, "chroma_db"),
+            "SQLALCHEMY_DATABASE_URL": "sqlite:///" + os.path.join(self.workdir, "sql_app.db"),
+            "PDF_URL": pdf_path,
+            "ANONYMIZED_TELEMETRY": "False",
+        })
+        for item in self.args.app_env:
+            key, value = item.split("=", 1)
+            env[key] = value
+        return env
+
+    def start_app(self, pdf_path: str, name: str):
+        port = free_port()
+        argv = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+                "--log-level", "warning"]
+        app = Process(name, argv, self.app_env(pdf_path), self.workdir)
+        startup = app.wait_ready(f"http://127.0.0.1:{port}/")
+        return app, f"http://127.0.0.1:{port}", startup
+
+    async def provider_stats(self, client: httpx.AsyncClient) -> Dict[str, dict]:
+        stats = {}
+        for name in self.ports:
+            stats.update((await client.get(self.provider_url(name) + "/_stats")).json())
+        return stats
+
+    async def reset_provider_stats(self, client: httpx.AsyncClient):
+        for name in self.ports:
+            await client.post(self.provider_url(name) + "/_reset")
+
+    # Ingestion
+
+    async def ingest(self, base_url: str, pages: int) -> dict:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            await self.reset_provider_stats(client)
+            started = time.perf_counter()
+            job = (await client.post("/documents/")).json()
+            stages, status = {}, job
+            while status["status"] not in ("succeeded", "failed", "cancelled"):
+                await asyncio.sleep(0.05)
+                status = (await client.get(f"/documents/jobs/{job['job_id']}")).json()
+                if status["stage"]:
+                    stages.setdefault(status["stage"], time.perf_counter() - started)
+            elapsed = time.perf_counter() - started
+            upstream = await self.provider_stats(client)
+        # Stage durations from the time each stage was first observed
+        order = sorted(stages.items(), key=lambda item: item[1])
+        durations = {
+            stage: (order[i + 1][1] if i + 1 < len(order) else elapsed) - at
+            for i, (stage, at) in enumerate(order)
+        }
+        return {
+            "pages": pages,
+            "status": status["status"],
+            "error": status.get("error"),
+            "seconds": elapsed,
+            "chunks": status.get("chunks_total") or 0,
+            "pages_per_second": pages / elapsed,
+            "chunks_per_second": (status.get("chunks_total") or 0) / elapsed,
+            "stages": durations,
+            "embedding_calls": upstream.get("openai.embeddings", {}).get("calls", 0),
+        }
+
+    # Messages
+
+    def prompts(self, count: int) -> List[str]:
+        rng = random.Random(self.args.seed)
+        mix = parse_mix(self.args.mix)
+        categories = rng.choices(list(mix), weights=list(mix.values()), k=count)
+        prompts = []
+        for i, category in enumerate(categories):
+            prompt = rng.choice(PROMPTS[category])
+            if rng.random() < self.args.unique:
+                prompt += f" (request {i})"  # defeats the answer cache and coalescing
+            prompts.append(prompt)
+        return prompts
+
+    @staticmethod
+    async def send(client: httpx.AsyncClient, prompt: str) -> dict:
+        started = time.perf_counter()
+        status = None
+        try:
+            response = await client.post("/messages/", json={"content": prompt})
+            status = response.status_code
+            ok = status == 200
+            category = response.json().get("category") if ok else None
+        except httpx.HTTPError:
+            ok, category = False, None
+        return {"ok": ok, "status": status, "category": category, "total": time.perf_counter() - started}
+
+    @staticmethod
+    async def send_stream(client: httpx.AsyncClient, prompt: str) -> dict:
+        started = time.perf_counter()
+        result = {"ok": False, "status": None, "category": None, "first_token": None}
+        try:
+            async with client.stream("POST", "/messages/stream", json={"content": prompt}) as response:
+                result["status"] = response.status_code
+                event = None
+                async for line in response.aiter_lines():
+                    if line.startswith("event: "):
+                        event = line[7:]
+                    elif line.startswith("data: "):
+                        if event == "category":
+                            result["category"] = json.loads(line[6:]).get("category")
+                        elif event == "token" and result["first_token"] is None:
+                            result["first_token"] = time.perf_counter() - started
+                        elif event == "done":
+                            result["ok"] = True
+                        elif event == "error":
+                            result["ok"] = False
+        except httpx.HTTPError:
+            pass
+        result["total"] = time.perf_counter() - started
+        return result
+
+    async def run_level(self, base_url: str, concurrency: int, stream: bool) -> dict:
+        prompts = self.prompts(self.args.requests)
+        send = self.send_stream if stream else self.send
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+            for prompt in prompts[:self.args.warmup]:
+                await send(client, prompt)
+            await self.reset_provider_stats(client)
+
+            queue = iter(prompts)
+            results = []
+
+            async def worker():
+                for prompt in queue:
+                    results.append(await send(client, prompt))
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+            upstream = await self.provider_stats(client)
+
+        totals = [r["total"] for r in results if r["ok"]]
+        level = {
+            "mode": "stream" if stream else "json",
+            "concurrency": concurrency,
+            "requests": len(results),
+            "errors": sum(not r["ok"] for r in results),
+            # 503/429 are the app pushing back (provider queue full or rate limited), not failures
+            "rejected": sum(r["status"] in (429, 503) for r in results),
+            "throughput": len(results) / elapsed,
+            "p50": percentile(totals, 50),
+            "p95": percentile(totals, 95),
+            "p99": percentile(totals, 99),
+            "by_category": {},
+            # Upstream work per request, as seen by the fake providers
+            "stages": {
+                operation: {"calls_per_request": entry["calls"] / len(results), "mean_ms": entry["mean_ms"],
+                            "errors": entry["errors"]}
+                for operation, entry in sorted(upstream.items())
+            },
+        }
+        for category in PROMPTS:
+            times = [r["total"] for r in results if r["ok"] and r["category"] == category]
+            if times:
+                level["by_category"][category] = {"count": len(times), "p50": percentile(times, 50),
+                                                  "p95": percentile(times, 95)}
+        if stream:
+            first_tokens = [r["first_token"] for r in results if r["ok"] and r["first_token"] is not None]
+            level["ttft_p50"] = percentile(first_tokens, 50)
+            level["ttft_p95"] = percentile(first_tokens, 95)
+        return level
+
+def print_ingestion(results: List[dict]):
+    print("\nIngestion")
+    print(f"{'pages':>6} {'status':>10} {'seconds':>8} {'chunks':>7} {'pages/s':>8} {'chunks/s':>9} {'embed calls':>12}  stages")
+    for r in results:
+        stages = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in r["stages"].items())
+        print(f"{r['pages']:>6} {r['status']:>10} {r['seconds']:>8.2f} {r['chunks']:>7} {r['pages_per_second']:>8.1f} "
+              f"{r['chunks_per_second']:>9.1f} {r['embedding_calls']:>12}  {stages}")
+        if r["error"]:
+            print(f"       error: {r['error']}")
+
+def print_level(level: dict):
+    ttft = f"  ttft p50 {level['ttft_p50'] * 1000:.0f}ms p95 {level['ttft_p95'] * 1000:.0f}ms" if "ttft_p50" in level else ""
+    rejected = f" ({level['rejected']} rejected with 429/503)" if level.get("rejected") else ""
+    print(f"\n{level['mode']} x{level['concurrency']}: {level['requests']} requests, {level['errors']} errors{rejected}, "
+          f"{level['throughput']:.1f} req/s, p50 {level['p50'] * 1000:.0f}ms p95 {level['p95'] * 1000:.0f}ms "
+          f"p99 {level['p99'] * 1000:.0f}ms{ttft}")
+    for category, entry in level["by_category"].items():
+        print(f"  {category:<8} n={entry['count']:<5} p50 {entry['p50'] * 1000:.0f}ms p95 {entry['p95'] * 1000:.0f}ms")
+    for operation, entry in level["stages"].items():
+        print(f"  upstream {operation:<20} {entry['calls_per_request']:.2f} calls/request, "
+              f"mean {entry['mean_ms']:.0f}ms, {entry['errors']} errors")
+
+def compare(current: dict, baseline: dict):
+    """Print relative changes against a previous --json result"""
+    def change(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    print("\nChange against baseline")
+    old_ingestion = {r["pages"]: r for r in baseline.get("ingestion", [])}
+    for r in current["ingestion"]:
+        old = old_ingestion.get(r["pages"])
+        if old:
+            print(f"  ingest {r['pages']} pages: pages/s {change(r['pages_per_second'], old['pages_per_second'])}")
+    old_levels = {(level["mode"], level["concurrency"]): level for level in baseline.get("messages", [])}
+    for level in current["messages"]:
+        old = old_levels.get((level["mode"], level["concurrency"]))
+        if old:
+            print(f"  {level['mode']} x{level['concurrency']}: throughput {change(level['throughput'], old['throughput'])}, "
+                  f"p95 {change(level['p95'], old['p95'])}, p99 {change(level['p99'], old['p99'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="messages per concurrency level")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured messages before each level")
+    parser.add_argument("--stream", action="store_true", help="also load /messages/stream")
+    parser.add_argument("--mix", default="food=0.6,weather=0.3,other=0.1", help="message category weights")
+    parser.add_argument("--unique", type=float, default=0.5, help="share of messages made unique")
+    parser.add_argument("--pdf-pages", default="20,100", help="comma-separated page counts to ingest ('' to skip)")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE", help="extra app setting")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline results file from an earlier --json run")
+    parser.add_argument("--keep", action="store_true", help="keep the work directory (logs, databases)")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="chat-benchmark-")
+    harness = Harness(args, workdir)
+    results = {"settings": vars(args), "startup_seconds": [], "ingestion": [], "messages": []}
+    app = None
+    try:
+        harness.start_providers()
+        pdf_path = ""
+        for pages in [int(p) for p in args.pdf_pages.split(",") if p]:
+            pdf_path = os.path.join(workdir, f"menu_{pages}p.pdf")
+            write_pdf(pdf_path, pages, seed=pages)
+            # The app ingests the PDF named in its settings, so each document gets its own app run
+            app, base_url, startup = harness.start_app(pdf_path, f"app_ingest_{pages}")
+            results["startup_seconds"].append(startup)
+            results["ingestion"].append(asyncio.run(harness.ingest(base_url, pages)))
+            app.stop()
+            app = None
+        if results["ingestion"]:
+            print_ingestion(results["ingestion"])
+
+        app, base_url, startup = harness.start_app(pdf_path, "app_messages")
+        results["startup_seconds"].append(startup)
+        print(f"\nApp startup: {', '.join(f'{s:.2f}s' for s in results['startup_seconds'])}")
+        for mode in (False, True) if args.stream else (False,):
+            for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                level = asyncio.run(harness.run_level(base_url, concurrency, mode))
+                results["messages"].append(level)
+                print_level(level)
+    finally:
+        if app is not None:
+            app.stop()
+        if harness.providers is not None:
+            harness.providers.stop()
+        print(f"\nLogs: {workdir}" if args.keep else "")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
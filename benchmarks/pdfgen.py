@@ -0,0 +1,81 @@
+"""Generate text PDFs of a given page count with the standard library only.
+
+Usage (from the project root):
+    python -m benchmarks.pdfgen out.pdf --pages 200
+"""
+import argparse
+import random
+from typing import List
+
+DISHES = [
+    "poke bowl", "kalua pork", "lomi salmon", "chicken long rice", "haupia", "loco moco",
+    "saimin", "spam musubi", "malasada", "laulau", "shoyu chicken", "garlic shrimp",
+]
+INGREDIENTS = [
+    "taro", "coconut milk", "sea salt", "ginger", "green onion", "sesame oil", "sweet potato",
+    "pineapple", "ti leaves", "soy sauce", "rice", "seaweed", "macadamia nuts", "brown sugar",
+]
+TEMPLATES = [
+    "To make {dish}, combine {a} with {b} and let it rest for {n} minutes.",
+    "Traditional {dish} is served with {a} and a side of {b}.",
+    "Many cooks add {a} to {dish} for a richer flavor, while others prefer {b}.",
+    "Store leftover {dish} in the refrigerator and reheat it gently with a splash of {a}.",
+    "The {dish} recipe calls for {n} cups of {a} and a pinch of {b}.",
+]
+
+def page_text(rng: random.Random, words: int) -> str:
+    sentences, count = [], 0
+    while count < words:
+        sentence = rng.choice(TEMPLATES).format(
+            dish=rng.choice(DISHES), a=rng.choice(INGREDIENTS), b=rng.choice(INGREDIENTS), n=rng.randint(2, 45)
+        )
+        sentences.append(sentence)
+        count += len(sentence.split())
+    return " ".join(sentences)
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def build_pdf(pages: List[str], line_chars: int = 90) -> bytes:
+    """A minimal PDF 1.4 file with one Helvetica text page per string"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    font_id = 3 + 2 * len(pages)
+    for i, text in enumerate(pages):
+        lines = [text[j:j + line_chars] for j in range(0, len(text), line_chars)]
+        stream = "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(f"({_escape(line)}) '" for line in lines) + " ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>".encode()
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+def write_pdf(path: str, pages: int, words_per_page: int = 350, seed: int = 0):
+    rng = random.Random(seed)
+    with open(path, "wb") as f:
+        f.write(build_pdf([f"Page {n + 1}. " + page_text(rng, words_per_page) for n in range(pages)]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--words-per-page", type=int, default=350)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_pdf(args.path, args.pages, args.words_per_page, args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Startup benchmark: how long importing the app takes and how soon a fresh server answers and is ready.
+
+Usage (from the project root):
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --pdf-pages 50 --app-env VECTOR_BACKEND=hnsw
+    python -m benchmarks.startup --app-env WARM_UP=false --json cold.json
+
+Every measurement runs in a new subprocess against local fake providers
+(benchmarks.fake_providers), with data in a temporary directory:
+
+- import: seconds to `import main`
+- first response: seconds from launching uvicorn to the first answer on /
+- ready: seconds from launching uvicorn until /ready returns 200
+
+With --pdf-pages a generated document is ingested first, so the warm-up has
+indexes to load. Medians across --runs are reported.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from benchmarks.fake_providers import add_profile_arguments
+from benchmarks.load_test import PROJECT_ROOT, Harness
+from benchmarks.pdfgen import write_pdf
+
+IMPORT_SCRIPT = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+
+def time_import(env) -> float:
+    output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], env=env, cwd=PROJECT_ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+def wait_ready(app, url: str, timeout: float = 120) -> float:
+    """Poll /ready until it returns 200; returns seconds since the app was launched"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if app.proc.poll() is not None:
+            raise RuntimeError(f"{app.name} exited with {app.proc.returncode}, see {app.log_path}")
+        try:
+            if httpx.get(url + "/ready", timeout=1).status_code == 200:
+                return time.perf_counter() - app.started
+        except httpx.TransportError:
+            pass
+        time.sleep(0.02)
+    raise RuntimeError(f"{app.name} was not ready in {timeout}s, see {app.log_path}")
+
+def summarize(values):
+    return {"median": statistics.median(values), "min": min(values), "max": max(values)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="measurements of each kind")
+    parser.add_argument("--pdf-pages", type=int, default=0, help="ingest a generated PDF of this many pages first")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE", help="extra app setting")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the work directory (logs, databases)")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="chat-startup-")
+    harness = Harness(args, workdir)
+    results = {"settings": vars(args), "import": [], "first_response": [], "ready": []}
+    app = None
+    try:
+        harness.start_providers()
+        pdf_path = ""
+        if args.pdf_pages:
+            pdf_path = os.path.join(workdir, f"menu_{args.pdf_pages}p.pdf")
+            write_pdf(pdf_path, args.pdf_pages, seed=args.pdf_pages)
+            app, base_url, _ = harness.start_app(pdf_path, "app_ingest")
+            ingestion = asyncio.run(harness.ingest(base_url, args.pdf_pages))
+            print(f"Ingested {args.pdf_pages} pages ({ingestion['chunks']} chunks) in {ingestion['seconds']:.2f}s")
+            app.stop()
+            app = None
+
+        env = harness.app_env(pdf_path)
+        for _ in range(args.runs):
+            results["import"].append(time_import(env))
+        for run in range(args.runs):
+            app, base_url, first_response = harness.start_app(pdf_path, f"app_{run}")
+            results["first_response"].append(first_response)
+            results["ready"].append(wait_ready(app, base_url))
+            app.stop()
+            app = None
+    finally:
+        if app is not None:
+            app.stop()
+        if harness.providers is not None:
+            harness.providers.stop()
+        print(f"Logs: {workdir}" if args.keep else "")
+
+    print(f"{'measurement':<16}{'median':>10}{'min':>10}{'max':>10}")
+    for name in ("import", "first_response", "ready"):
+        summary = summarize(results[name])
+        print(f"{name:<16}{summary['median']:>9.3f}s{summary['min']:>9.3f}s{summary['max']:>9.3f}s")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Recall@k and query latency for each vector backend on a synthetic corpus.
+
+Usage (from the project root):
+    python -m benchmarks.vector_backends --vectors 20000 --queries 500 --k 10
+
+Ground truth is exact brute-force search, so the numpy backend should report
+recall 1.0; chroma and hnsw show what their approximate graphs give up.
+"""
+import argparse
+import os
+import tempfile
+import time
+import chromadb
+import numpy as np
+from database.vector_index import create_backend
+
+def synthetic_corpus(count: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """Unit vectors scattered around random centroids, roughly like topical document chunks"""
+    centroids = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centroids[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def percentile(values, pct):
+    return float(np.percentile(np.asarray(values), pct))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--backends", default="chroma,numpy,hnsw")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    corpus = synthetic_corpus(args.vectors, args.dim, args.clusters, rng)
+    queries = corpus[rng.integers(0, args.vectors, args.queries)] + 0.3 * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    # Exact top-k by cosine similarity
+    truth = np.argsort(-(queries @ corpus.T), axis=1)[:, :args.k]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        client = chromadb.PersistentClient(path=os.path.join(workdir, "chroma"))
+        collection = client.create_collection("benchmark", embedding_function=None)
+        ids = [str(i) for i in range(args.vectors)]
+        start = time.perf_counter()
+        for offset in range(0, args.vectors, 5000):
+            collection.add(
+                ids=ids[offset:offset + 5000],
+                embeddings=corpus[offset:offset + 5000].tolist(),
+                documents=[f"doc {i}" for i in range(offset, min(offset + 5000, args.vectors))],
+                metadatas=[{"n": i} for i in range(offset, min(offset + 5000, args.vectors))]
+            )
+        print(f"Loaded {args.vectors} x {args.dim} vectors into Chroma in {time.perf_counter() - start:.1f}s\n")
+
+        print(f"{'backend':<8} {'build s':>8} {'load s':>8} {'recall@' + str(args.k):>10} {'p50 ms':>8} {'p99 ms':>8}")
+        for name in args.backends.split(","):
+            index_dir = os.path.join(workdir, "index")
+            backend = create_backend(name, collection, index_dir)
+            start = time.perf_counter()
+            backend.query(queries[:1].tolist(), args.k)  # first query exports/builds the index
+            build_seconds = time.perf_counter() - start
+
+            # Reopen from the persisted (memory-mapped) files, as a restarted worker would
+            backend = create_backend(name, collection, index_dir)
+            start = time.perf_counter()
+            backend.query(queries[:1].tolist(), args.k)
+            load_seconds = time.perf_counter() - start
+
+            latencies, hits = [], 0
+            for row, query in enumerate(queries):
+                start = time.perf_counter()
+                result = backend.query([query.tolist()], args.k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                hits += len({int(i) for i in result["ids"][0]} & set(truth[row].tolist()))
+            recall = hits / (args.queries * args.k)
+            print(f"{name:<8} {build_seconds:>8.2f} {load_seconds:>8.2f} {recall:>10.3f} "
+                  f"{percentile(latencies, 50):>8.2f} {percentile(latencies, 99):>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import math
+import re
+from collections import Counter
+from typing import Iterable, Optional, Tuple
+from sqlalchemy.orm import Session
+from models import Message
+from config import Config
+
+CATEGORIES = ("food", "weather", "other")
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+# Keyword rules: a single matching category is a strong local signal
+KEYWORD_RULES = {
+    "weather": re.compile(
+        r"\b(weather|forecast|temperatures?|rain(s|ing|y)?|snow(s|ing|y)?|sunny|cloudy|"
+        r"humid(ity)?|wind(s|y)?|storms?|thunder|degrees|celsius|fahrenheit|umbrella|"
+        r"fog(gy)?|hail|heatwave|freezing)\b"
+    ),
+    "food": re.compile(
+        r"\b(food|foods|dish(es)?|recipes?|cook(s|ing|ed)?|eat(s|ing)?|meals?|cuisine|"
+        r"ingredients?|restaurants?|breakfast|lunch|dinner|desserts?|snacks?|menu|"
+        r"bak(e|ed|ing)|fried|grill(ed)?|sauces?|soups?|taste|flavou?rs?|spicy|drinks?)\b"
+    ),
+}
+
+# Confidence assigned to an unambiguous rule hit when no trained model is available
+RULE_CONFIDENCE = 0.9
+
+
+def tokenize(text: str):
+    return _TOKEN_RE.findall(text.lower())
+
+
+class LocalClassifier:
+    """In-process food/weather/other classifier: keyword rules plus multinomial Naive Bayes"""
+
+    def __init__(self, threshold: float = Config.CLASSIFIER_CONFIDENCE_THRESHOLD):
+        self.threshold = threshold
+        self.class_counts = Counter()
+        self.token_counts = {category: Counter() for category in CATEGORIES}
+        self.token_totals = Counter()
+        self.vocabulary = set()
+        self.stats = {"local_hits": 0, "llm_fallbacks": 0}
+
+    @property
+    def is_trained(self) -> bool:
+        return sum(self.class_counts.values()) > 0
+
+    def learn(self, text: str, category: str):
+        """Add one labelled example to the model"""
+        if category not in CATEGORIES:
+            return
+        tokens = tokenize(text)
+        self.class_counts[category] += 1
+        self.token_counts[category].update(tokens)
+        self.token_totals[category] += len(tokens)
+        self.vocabulary.update(tokens)
+
+    def train(self, samples: Iterable[Tuple[str, str]]):
+        """Train on (content, category) pairs"""
+        for text, category in samples:
+            self.learn(text, category)
+
+    def train_from_db(self, db_session: Session, limit: int = Config.CLASSIFIER_TRAINING_LIMIT) -> int:
+        """Train on the most recent LLM-labelled user messages from the messages table.
+
+        Messages the local classifier labelled itself are left out, so a restart
+        doesn't retrain the model on its own predictions.
+        """
+        rows = (
+            db_session.query(Message.content, Message.category)
+            .filter(Message.is_ai.is_(False), Message.category.isnot(None), Message.category_source == "llm")
+            .order_by(Message.id.desc())
+            .limit(limit)
+            .all()
+        )
+        self.train((row.content or "", row.category) for row in rows)
+        return len(rows)
+
+    def _model_probabilities(self, tokens):
+        total_docs = sum(self.class_counts.values())
+        vocab_size = len(self.vocabulary) or 1
+        log_scores = {}
+        for category in CATEGORIES:
+            # Laplace smoothing on both priors and token likelihoods
+            score = math.log((self.class_counts[category] + 1) / (total_docs + len(CATEGORIES)))
+            denominator = self.token_totals[category] + vocab_size
+            counts = self.token_counts[category]
+            for token in tokens:
+                score += math.log((counts[token] + 1) / denominator)
+            log_scores[category] = score
+        top = max(log_scores.values())
+        exp_scores = {category: math.exp(score - top) for category, score in log_scores.items()}
+        norm = sum(exp_scores.values())
+        return {category: value / norm for category, value in exp_scores.items()}
+
+    def predict(self, text: str) -> Tuple[Optional[str], float]:
+        """Return (category, confidence); category is None when there is no usable signal"""
+        lowered = text.lower()
+        rule_hits = [category for category, pattern in KEYWORD_RULES.items() if pattern.search(lowered)]
+        rule_category = rule_hits[0] if len(rule_hits) == 1 else None
+
+        if not self.is_trained:
+            if rule_category is None:
+                return None, 0.0
+            return rule_category, RULE_CONFIDENCE
+
+        probabilities = self._model_probabilities(tokenize(text))
+        category = max(probabilities, key=probabilities.get)
+        if rule_category is None:
+            return category, probabilities[category]
+        if category == rule_category:
+            # Rule and model agree
+            return category, max(RULE_CONFIDENCE, probabilities[category])
+        # Rule and model disagree: equal-weight blend of the posterior and the rule's one-hot vote
+        blended = {
+            name: (probability + (1.0 if name == rule_category else 0.0)) / 2
+            for name, probability in probabilities.items()
+        }
+        category = max(blended, key=blended.get)
+        return category, blended[category]
+
+    def classify(self, text: str) -> Optional[str]:
+        """Return a category if the local prediction clears the threshold, else None (and count a fallback)"""
+        category, confidence = self.predict(text)
+        if category is not None and confidence >= self.threshold:
+            self.stats["local_hits"] += 1
+            return category
+        self.stats["llm_fallbacks"] += 1
+        return None
+
+    def get_stats(self):
+        total = self.stats["local_hits"] + self.stats["llm_fallbacks"]
+        return {
+            **self.stats,
+            "hit_rate": self.stats["local_hits"] / total if total else 0.0,
+            "threshold": self.threshold,
+            "training_examples": sum(self.class_counts.values())
+        }
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import httpx
+from typing import Iterable, Optional
+from fastapi import Request
+from database.chroma_client import IMPORT_LOCK, ChromaDatabase
+from classifier import LocalClassifier
+from coalescing import CoalescingClient, SingleFlight
+from semantic_cache import SemanticCache
+from weatherapi import WeatherProvider
+from pdf_parser import create_parse_pool
+from scheduler import INGEST, ProviderScheduler, ScheduledClient
+from telemetry import current_traceparent, stats_gauges
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+async def _propagate_trace(request: httpx.Request):
+    traceparent = current_traceparent()
+    if traceparent:
+        request.headers["traceparent"] = traceparent
+
+def _pooled_http_client() -> httpx.AsyncClient:
+    """Create a keep-alive HTTP client sized from config"""
+    return httpx.AsyncClient(
+        # Upstream calls carry the current span's trace context when TRACE_CONTEXT is on
+        event_hooks={"request": [_propagate_trace]} if Config.TRACE_CONTEXT else None,
+        limits=httpx.Limits(
+            max_connections=Config.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=Config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=Config.HTTP_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(Config.HTTP_TIMEOUT, connect=Config.HTTP_CONNECT_TIMEOUT)
+    )
+
+class ClientRegistry:
+    """Provider clients and the Chroma handle, created once per application lifespan"""
+
+    def __init__(self):
+        # One connection pool per provider so a slow provider can't starve the others
+        self.openai_http = _pooled_http_client()
+        self.groq_http = _pooled_http_client()
+        self.weather_http = _pooled_http_client()
+
+        # SDK clients are created on first use (or by the startup warm-up): importing the SDKs is slow
+        self._openai_client = None
+        self._groq_client = None
+        self.provider_urls = {}  # provider -> API base URL, known once its client exists
+        self.schedulers = {}
+        if Config.PROVIDER_SCHEDULING:
+            self.schedulers = {
+                "openai": ProviderScheduler("openai", Config.OPENAI_MAX_CONCURRENCY,
+                                            Config.OPENAI_REQUESTS_PER_MINUTE, Config.OPENAI_TOKENS_PER_MINUTE),
+                "groq": ProviderScheduler("groq", Config.GROQ_MAX_CONCURRENCY,
+                                          Config.GROQ_REQUESTS_PER_MINUTE, Config.GROQ_TOKENS_PER_MINUTE),
+            }
+        # Identical concurrent upstream calls (same provider, method and arguments) share one request
+        self.flight = SingleFlight()
+        self.chroma_db = ChromaDatabase()
+        # Multi-worker mode: pick up ingestion writes made by the other workers
+        self._sync_task = asyncio.create_task(self._sync_vector_store()) if self.chroma_db.remote else None
+        if Config.PROVIDER_SCHEDULING:
+            # Ingestion embeds from worker threads; it shares OpenAI's limits at the lowest priority
+            loop = asyncio.get_running_loop()
+            self.chroma_db.embedding_gate = lambda tokens: self.schedulers["openai"].hold_from_thread(loop, INGEST, tokens)
+        self.weather = WeatherProvider(self.weather_http, flight=self.flight)
+        self.parse_pool = create_parse_pool()
+        self.classifier = LocalClassifier()
+        self.semantic_cache = SemanticCache() if Config.SEMANTIC_CACHE_ENABLED else None
+        if self.semantic_cache is not None:
+            # Cached answers are only valid for the chunks they were generated from
+            self.chroma_db.on_change("document_chunks", self.semantic_cache.invalidate)
+        # How food queries were answered: BM25 alone, fused, vector alone, or BM25 after an embedding failure
+        self.retrieval_stats = {"lexical_only": 0, "hybrid": 0, "vector_only": 0, "embedding_fallbacks": 0,
+                                "context_tokens": 0, "context_tokens_saved": 0}
+
+    def _wrap(self, client, provider: str):
+        self.provider_urls[provider] = str(client.base_url)
+        if provider in self.schedulers:
+            client = ScheduledClient(client, self.schedulers[provider])
+        if Config.UPSTREAM_COALESCING:
+            client = CoalescingClient(client, provider, self.flight)
+        return client
+
+    @property
+    def openai_client(self):
+        if self._openai_client is None:
+            with IMPORT_LOCK:
+                if self._openai_client is None:
+                    from openai import AsyncOpenAI
+                    self._openai_client = self._wrap(AsyncOpenAI(
+                        api_key=Config.OPENAI_API_KEY, http_client=self.openai_http, max_retries=self._sdk_retries()
+                    ), "openai")
+        return self._openai_client
+
+    @property
+    def groq_client(self):
+        if self._groq_client is None:
+            with IMPORT_LOCK:
+                if self._groq_client is None:
+                    from groq import AsyncGroq
+                    self._groq_client = self._wrap(AsyncGroq(
+                        api_key=Config.GROQ_API_KEY, http_client=self.groq_http, max_retries=self._sdk_retries()
+                    ), "groq")
+        return self._groq_client
+
+    @staticmethod
+    def _sdk_retries() -> int:
+        # The schedulers retry (honoring Retry-After), so the SDKs' own retries are turned off under them
+        return 0 if Config.PROVIDER_SCHEDULING else 2
+
+    def metric_samples(self):
+        """Component counters as gauge samples for /metrics"""
+        samples = {}
+        samples.update(stats_gauges("classifier", self.classifier.get_stats()))
+        samples.update(stats_gauges("weather", self.weather.get_stats()))
+        samples.update(stats_gauges("retrieval", self.retrieval_stats))
+        if self.semantic_cache is not None:
+            samples.update(stats_gauges("semantic_cache", self.semantic_cache.get_stats()))
+        for provider, scheduler in self.schedulers.items():
+            samples.update(stats_gauges(f"scheduler_{provider}", scheduler.stats))
+            samples[("chat_provider_in_flight", (("provider", provider),))] = scheduler.in_flight
+            for priority, depth in scheduler.queue_depth().items():
+                samples[("chat_provider_queue_depth", (("provider", provider), ("priority", priority)))] = depth
+        for operation, counters in self.flight.stats.items():
+            samples[("chat_upstream_calls", (("operation", operation),))] = counters["calls"]
+            samples[("chat_upstream_coalesced", (("operation", operation),))] = counters["coalesced"]
+        return samples
+
+    def check_capacity(self, providers: Optional[Iterable[str]] = None):
+        """Raise ProviderUnavailable (503) when the queue of a provider (any given one, default all) is full,
+        before starting work that needs it"""
+        for provider, scheduler in self.schedulers.items():
+            if providers is None or provider in providers:
+                scheduler.check_capacity()
+
+    async def _sync_vector_store(self):
+        while True:
+            await asyncio.sleep(Config.CHROMA_SYNC_INTERVAL)
+            try:
+                changed = await asyncio.to_thread(self.chroma_db.sync_remote_changes)
+                if changed:
+                    logger.info("Collections changed by another worker: %s", ", ".join(changed))
+            except Exception as e:
+                logger.warning("Checking the Chroma server for changes failed: %s", e)
+
+    async def aclose(self):
+        """Close pooled connections on shutdown"""
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+        for scheduler in self.schedulers.values():
+            scheduler.close()
+        await self.openai_http.aclose()
+        await self.groq_http.aclose()
+        await self.weather_http.aclose()
+        self.parse_pool.shutdown(cancel_futures=True)
+
+# Registry dependency
+def get_clients(request: Request) -> ClientRegistry:
+    return request.app.state.clients
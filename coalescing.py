@@ -0,0 +1,82 @@
+import asyncio
+import functools
+import inspect
+import json
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+# Attribute values returned as-is by CoalescingClient instead of being wrapped
+_PLAIN_TYPES = (str, bytes, int, float, bool, type(None), dict, list, tuple)
+
+def request_key(args: tuple, kwargs: dict) -> str:
+    """Canonical form of a call's arguments (sorted keys, so argument order doesn't matter)"""
+    return json.dumps([args, kwargs], sort_keys=True, default=str)
+
+class SingleFlight:
+    """Concurrent callers with the same key share one in-flight call and its result"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}  # name -> {"calls", "coalesced"}
+
+    def start(self, name: str, key: Hashable, call: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """Start call() under key, or join the call already running for it"""
+        counters = self.stats.setdefault(name, {"calls": 0, "coalesced": 0})
+        task = self._inflight.get(key)
+        if task is not None:
+            counters["coalesced"] += 1
+            return task
+        counters["calls"] += 1
+        task = asyncio.ensure_future(call())
+        self._inflight[key] = task
+        task.add_done_callback(functools.partial(self._done, key))
+        return task
+
+    def _done(self, key: Hashable, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # callers that gave up shouldn't leave "exception never retrieved" warnings
+
+    async def do(self, name: str, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        # Shielded: one caller being cancelled must not cancel the call the others are waiting on
+        return await asyncio.shield(self.start(name, key, call))
+
+    def get_stats(self):
+        return {
+            "in_flight": len(self._inflight),
+            "calls": sum(counters["calls"] for counters in self.stats.values()),
+            "coalesced": sum(counters["coalesced"] for counters in self.stats.values()),
+            "by_operation": self.stats
+        }
+
+class CoalescingClient:
+    """Proxy over a provider SDK client that coalesces identical concurrent async calls.
+
+    Resources such as ``chat.completions`` come back wrapped, and their async
+    methods are keyed on provider, method path and arguments. Streaming calls
+    are passed through, since a stream can only be consumed once.
+    """
+
+    def __init__(self, target, provider: str, flight: SingleFlight, path: str = ""):
+        self._target = target
+        self._provider = provider
+        self._flight = flight
+        self._path = path
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        if name.startswith("_"):
+            return attr
+        path = f"{self._path}.{name}" if self._path else name
+        if inspect.iscoroutinefunction(inspect.unwrap(attr)):
+            return functools.partial(self._call, attr, path)
+        if callable(attr) or isinstance(attr, _PLAIN_TYPES):
+            return attr
+        return CoalescingClient(attr, self._provider, self._flight, path)
+
+    async def _call(self, method, path: str, *args, **kwargs):
+        if kwargs.get("stream"):
+            return await method(*args, **kwargs)
+        name = f"{self._provider}.{path}"
+        key = (name, request_key(args, kwargs))
+        return await self._flight.do(name, key, lambda: method(*args, **kwargs))
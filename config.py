@@ -4,11 +4,21 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+def _parse_float_map(value):
+    """Parse 'key=1.5,other=2' into {'key': 1.5, 'other': 2.0}"""
+    result = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            key, number = item.rsplit('=', 1)
+            result[key.strip()] = float(number)
+    return result
+
 class Config:
     # OpenAI
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
     OPENAI_MODEL = os.getenv('OPENAI_CHAT_MODEL')
     OPENAI_EMBEDDING_MODEL = os.getenv('OPENAI_EMBEDDING_MODEL')
+    EMBEDDING_DIMENSIONS = 1536
     
     #Groq
     GROQ_API_KEY = os.getenv('GROQ_API_KEY')
@@ -16,12 +26,110 @@ class Config:
 
     # Database
     CHROMADB_PATH = os.getenv('CHROMA_DB_PATH')
+    CHROMA_SERVER_URL = os.getenv('CHROMA_SERVER_URL')  # e.g. http://127.0.0.1:8001; set for multi-worker mode (serve.py)
+    CHROMA_SYNC_INTERVAL = float(os.getenv('CHROMA_SYNC_INTERVAL', 1.0))  # seconds between checks for other workers' writes
     SQLALCHEMY_DATABASE_URL = os.getenv('SQLALCHEMY_DATABASE_URL')
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))
+    DB_ASYNC = os.getenv('DB_ASYNC', 'false').lower() == 'true'  # AsyncSession (aiosqlite / asyncpg) for the message and document paths
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')  # OFF / NORMAL / FULL
+    SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', 30))  # seconds a writer waits for the lock
+    SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 65536))
+
+    # Write-behind batching for chat messages
+    MESSAGE_WRITE_BEHIND = os.getenv('MESSAGE_WRITE_BEHIND', 'false').lower() == 'true'
+    MESSAGE_WRITE_BATCH_SIZE = int(os.getenv('MESSAGE_WRITE_BATCH_SIZE', 500))  # rows per transaction
+    MESSAGE_WRITE_INTERVAL = float(os.getenv('MESSAGE_WRITE_INTERVAL', 0.05))  # seconds to gather a batch
+    MESSAGE_WRITE_RETRIES = int(os.getenv('MESSAGE_WRITE_RETRIES', 3))
+    MESSAGE_WRITE_RETRY_BACKOFF = float(os.getenv('MESSAGE_WRITE_RETRY_BACKOFF', 0.2))
     
+    # Local message classifier (falls back to the LLM below this confidence)
+    CLASSIFIER_CONFIDENCE_THRESHOLD = float(os.getenv('CLASSIFIER_CONFIDENCE_THRESHOLD', 0.8))
+    CLASSIFIER_TRAINING_LIMIT = int(os.getenv('CLASSIFIER_TRAINING_LIMIT', 5000))
+
+    # POST /messages/batch
+    BATCH_MAX_MESSAGES = int(os.getenv('BATCH_MAX_MESSAGES', 500))
+    BATCH_CLASSIFY_SIZE = int(os.getenv('BATCH_CLASSIFY_SIZE', 50))  # messages per packed classification call
+    BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 8))  # answers generated at once per batch
+
+    # Semantic answer cache for food queries
+    SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'true').lower() == 'true'
+    SEMANTIC_CACHE_MAX_DISTANCE = float(os.getenv('SEMANTIC_CACHE_MAX_DISTANCE', 0.08))  # cosine distance
+    SEMANTIC_CACHE_TTL = float(os.getenv('SEMANTIC_CACHE_TTL', 3600))  # seconds
+    SEMANTIC_CACHE_MAX_BYTES = int(os.getenv('SEMANTIC_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
     # PDF Processing
     CHUNK_SIZE = 1000
     CHUNK_OVERLAP = 200
+
+    # Embedding ingestion
+    EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', 100))  # texts per embedding request
+    EMBEDDING_BATCH_MAX_CHARS = int(os.getenv('EMBEDDING_BATCH_MAX_CHARS', 200000))  # ~50k tokens per request
+    EMBEDDING_CONCURRENCY = int(os.getenv('EMBEDDING_CONCURRENCY', 4))  # embedding requests in flight
+    EMBEDDING_MAX_RETRIES = int(os.getenv('EMBEDDING_MAX_RETRIES', 5))
+    EMBEDDING_RETRY_BACKOFF = float(os.getenv('EMBEDDING_RETRY_BACKOFF', 1.0))  # seconds, doubled per attempt
+    EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH') or os.path.join(CHROMADB_PATH or '.', 'embedding_cache.sqlite3')
+    CHROMA_WRITE_BATCH_SIZE = int(os.getenv('CHROMA_WRITE_BATCH_SIZE', 1000))
+
+    # Vector search backend: chroma (query Chroma directly), numpy (exact, in-memory) or hnsw (approximate)
+    VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'chroma')
+    VECTOR_INDEX_PATH = os.getenv('VECTOR_INDEX_PATH') or os.path.join(CHROMADB_PATH or '.', 'vector_index')
+    HNSW_M = int(os.getenv('HNSW_M', 16))
+    HNSW_EF_CONSTRUCTION = int(os.getenv('HNSW_EF_CONSTRUCTION', 200))
+    HNSW_EF_SEARCH = int(os.getenv('HNSW_EF_SEARCH', 64))
+
+    # Hybrid retrieval: BM25 over chunks fused with vector results (reciprocal rank fusion)
+    HYBRID_SEARCH = os.getenv('HYBRID_SEARCH', 'true').lower() == 'true'
+    LEXICAL_CONFIDENCE = float(os.getenv('LEXICAL_CONFIDENCE', 0.85))  # skip the query embedding above this
+    RETRIEVAL_CANDIDATES = int(os.getenv('RETRIEVAL_CANDIDATES', 10))  # per retriever, before fusion
+    RRF_K = int(os.getenv('RRF_K', 60))
+
+    # Prompt context for food queries: adjacent chunks merged, near-duplicates dropped, filled best-first
+    CONTEXT_MAX_CHUNKS = int(os.getenv('CONTEXT_MAX_CHUNKS', 3))  # retrieved chunks considered
+    CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', 750))  # three full chunks, the old top-3 join
+    CONTEXT_MIN_RELATIVE_SCORE = float(os.getenv('CONTEXT_MIN_RELATIVE_SCORE', 0.3))  # of the best chunk's score
+    CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv('CONTEXT_DUPLICATE_THRESHOLD', 0.8))  # shared word 3-grams
+    CONTEXT_CHARS_PER_TOKEN = int(os.getenv('CONTEXT_CHARS_PER_TOKEN', 4))
+
+    # Background ingestion jobs
+    INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', 1))  # documents processed concurrently
+    INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', 16))  # queued jobs before submissions are rejected
+    INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 200))  # chunks per embedding/progress step
+    INGEST_RECOVER_JOBS = os.getenv('INGEST_RECOVER_JOBS', 'true').lower() == 'true'  # fail unfinished jobs at startup; when false only those of exited processes (serve.py)
+
+    # PDF parsing process pool
+    PDF_PARSE_WORKERS = int(os.getenv('PDF_PARSE_WORKERS', os.cpu_count() or 1))
+    PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', 16))  # pages parsed per pool task
+    PDF_PARSE_READ_AHEAD = int(os.getenv('PDF_PARSE_READ_AHEAD', 2 * PDF_PARSE_WORKERS))  # page ranges parsed ahead of the embedder
     
+    # Outbound HTTP connection pools (shared per provider for the whole process)
+    HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', 100))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('HTTP_MAX_KEEPALIVE_CONNECTIONS', 20))
+    HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', 30))
+    HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 60))
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+    # Share one in-flight request among concurrent identical OpenAI/Groq calls
+    UPSTREAM_COALESCING = os.getenv('UPSTREAM_COALESCING', 'true').lower() == 'true'
+
+    # Per-provider scheduling of OpenAI/Groq calls: concurrency, rate limits (0 = unlimited), queueing and retries
+    PROVIDER_SCHEDULING = os.getenv('PROVIDER_SCHEDULING', 'true').lower() == 'true'
+    OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', 32))
+    OPENAI_REQUESTS_PER_MINUTE = float(os.getenv('OPENAI_REQUESTS_PER_MINUTE', 0))
+    OPENAI_TOKENS_PER_MINUTE = float(os.getenv('OPENAI_TOKENS_PER_MINUTE', 0))
+    GROQ_MAX_CONCURRENCY = int(os.getenv('GROQ_MAX_CONCURRENCY', 16))
+    GROQ_REQUESTS_PER_MINUTE = float(os.getenv('GROQ_REQUESTS_PER_MINUTE', 0))
+    GROQ_TOKENS_PER_MINUTE = float(os.getenv('GROQ_TOKENS_PER_MINUTE', 0))
+    PROVIDER_MAX_QUEUE = int(os.getenv('PROVIDER_MAX_QUEUE', 200))  # waiting calls per provider before 503s
+    PROVIDER_QUEUE_TIMEOUT = float(os.getenv('PROVIDER_QUEUE_TIMEOUT', 30))  # seconds a call may wait for a slot
+    PROVIDER_MAX_RETRIES = int(os.getenv('PROVIDER_MAX_RETRIES', 3))
+    PROVIDER_RETRY_BACKOFF = float(os.getenv('PROVIDER_RETRY_BACKOFF', 0.5))  # seconds, doubled per attempt, jittered
+    PROVIDER_RETRY_MAX_DELAY = float(os.getenv('PROVIDER_RETRY_MAX_DELAY', 20))  # longer Retry-After waits fail fast
+
+    # Logging, metrics and tracing
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    TRACE_CONTEXT = os.getenv('TRACE_CONTEXT', 'false').lower() == 'true'  # W3C traceparent in/out, span logs
+    DEBUG_PAYLOAD_SAMPLE_RATE = float(os.getenv('DEBUG_PAYLOAD_SAMPLE_RATE', 0.0))  # share of requests logging prompts/chunks/responses
+
     # API Configuration
     #API_HOST = "localhost"
     #API_PORT = 8000
@@ -33,4 +141,12 @@ class Config:
     WEATHER_API_KEY = os.getenv('WEATHER_API_KEY')
     WEATHER_API_URL = os.getenv('WEATHER_API_URL')
     WEATHER_LOCATION = os.getenv('WEATHER_LOCATION')
+    WEATHER_CACHE_TTL = float(os.getenv('WEATHER_CACHE_TTL', 600))  # seconds a reading counts as fresh
+    WEATHER_CACHE_TTL_OVERRIDES = _parse_float_map(os.getenv('WEATHER_CACHE_TTL_OVERRIDES'))  # e.g. "New York=300,London=900"
+    WEATHER_CACHE_MAX_STALE = float(os.getenv('WEATHER_CACHE_MAX_STALE', 3600))  # how long past the TTL a reading may still be served
+    WEATHER_WARM_UP = os.getenv('WEATHER_WARM_UP', 'true').lower() == 'true'
+
+    # Startup
+    WARM_UP = os.getenv('WARM_UP', 'true').lower() == 'true'  # open Chroma, load indexes and pre-connect to providers after startup
+    WARM_UP_BLOCKING = os.getenv('WARM_UP_BLOCKING', 'false').lower() == 'true'  # finish the warm-up before accepting requests
     
\ No newline at end of file
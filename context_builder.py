@@ -0,0 +1,120 @@
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from retrieval import relevance_scores
+from config import Config
+
+_WORD_RE = re.compile(r"\w+")
+# Savings are measured against the previous prompt context: the top 3 chunks joined verbatim
+BASELINE_CHUNKS = 3
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (no tokenizer dependency); only used to compare and budget context sizes"""
+    return math.ceil(len(text) / Config.CONTEXT_CHARS_PER_TOKEN) if text else 0
+
+def merge_overlapping(first: str, second: str, max_overlap: int = Config.CHUNK_OVERLAP, min_overlap: int = 20) -> str:
+    """Join two consecutive chunks, writing the text the splitter repeated between them only once"""
+    for size in range(min(len(first), len(second), max_overlap), min_overlap - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + " " + second
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _containment(a: set, b: set) -> float:
+    """Share of the smaller passage's word 3-grams that also occur in the other"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+class Passage:
+    """One or more consecutive chunks of the same page, merged into a single piece of context"""
+
+    def __init__(self, text: str, metadata: dict, score: float, chunk: Optional[int]):
+        self.text = text
+        self.metadata = metadata
+        self.score = score
+        self.first_chunk = self.last_chunk = chunk
+        self.chunks = 1
+
+    def key(self) -> Tuple[Any, Any]:
+        return self.metadata.get("namespace"), self.metadata.get("page")
+
+    def follows(self, other: "Passage") -> bool:
+        return (other.key() == self.key() and self.first_chunk is not None and other.last_chunk is not None
+                and self.first_chunk == other.last_chunk + 1)
+
+    def extend(self, other: "Passage"):
+        self.text = merge_overlapping(self.text, other.text)
+        self.score = max(self.score, other.score)
+        self.last_chunk = other.last_chunk
+        self.chunks += other.chunks
+
+def _merge_adjacent(passages: List[Passage]) -> Tuple[List[Passage], int]:
+    """Merge chunks that are consecutive on the same page; returns the passages and how many merges happened"""
+    ordered = sorted(passages, key=lambda p: (str(p.key()), p.first_chunk if p.first_chunk is not None else -1))
+    merged, merges = [], 0
+    for passage in ordered:
+        if merged and passage.follows(merged[-1]):
+            merged[-1].extend(passage)
+            merges += 1
+        else:
+            merged.append(passage)
+    return merged, merges
+
+def build_context(results: Dict[str, Any], token_budget: int = Config.CONTEXT_TOKEN_BUDGET,
+                  min_relative_score: float = Config.CONTEXT_MIN_RELATIVE_SCORE,
+                  duplicate_threshold: float = Config.CONTEXT_DUPLICATE_THRESHOLD) -> Tuple[str, Dict[str, int]]:
+    """Assemble retrieved chunks into prompt context within a token budget.
+
+    Consecutive chunks of the same page are merged (their shared overlap kept
+    once), near-duplicate passages are dropped, and the remaining passages are
+    taken best-first until the budget is spent. Returns the context and counters,
+    including tokens saved against the previous top-3 verbatim join.
+    """
+    documents, metadatas = results["documents"][0], results["metadatas"][0]
+    scores = relevance_scores(results)
+    baseline_tokens = estimate_tokens("\n".join(documents[:BASELINE_CHUNKS]))
+    top_score = max(scores, default=0.0)
+
+    candidates = [
+        Passage(text, metadata or {}, score, (metadata or {}).get("chunk"))
+        for text, metadata, score in zip(documents, metadatas, scores)
+        if top_score <= 0 or score >= top_score * min_relative_score
+    ]
+    passages, merges = _merge_adjacent(candidates)
+
+    kept, kept_shingles, duplicates, over_budget, used = [], [], 0, 0, 0
+    for passage in sorted(passages, key=lambda p: p.score, reverse=True):
+        shingles = _shingles(passage.text)
+        if any(_containment(shingles, other) >= duplicate_threshold for other in kept_shingles):
+            duplicates += 1
+            continue
+        tokens = estimate_tokens(passage.text)
+        if used + tokens > token_budget:
+            if kept:
+                over_budget += 1  # a shorter, less relevant passage may still fit
+                continue
+            # Always answer from something: the best passage alone is cut to the budget
+            passage.text = passage.text[:token_budget * Config.CONTEXT_CHARS_PER_TOKEN]
+            tokens = estimate_tokens(passage.text)
+        kept.append(passage)
+        kept_shingles.append(shingles)
+        used += tokens
+
+    context = "\n\n".join(passage.text for passage in kept)
+    context_tokens = estimate_tokens(context)
+    return context, {
+        "candidates": len(documents),
+        "below_min_score": len(documents) - len(candidates),
+        "merged": merges,
+        "duplicates_removed": duplicates,
+        "over_budget": over_budget,
+        "passages": len(kept),
+        "context_tokens": context_tokens,
+        "tokens_saved": max(baseline_tokens - context_tokens, 0)
+    }
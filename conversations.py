@@ -0,0 +1,69 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+from models import Conversation, Message
+from db import commit
+
+class InvalidCursor(Exception):
+    """Raised when a pagination cursor can't be decoded"""
+
+def message_to_dict(message: Message) -> dict:
+    return {
+        "id": message.id,
+        "conversation_id": message.conversation_id,
+        "reply_to_id": message.reply_to_id,
+        "is_ai": message.is_ai,
+        "content": message.content,
+        "category": message.category,
+        "timestamp": message.timestamp
+    }
+
+def conversation_to_dict(conversation: Conversation) -> dict:
+    return {
+        "id": conversation.id,
+        "title": conversation.title,
+        "created_at": conversation.created_at
+    }
+
+def encode_cursor(message: Message) -> str:
+    """Opaque cursor pointing just past `message` in (timestamp, id) order"""
+    payload = json.dumps({"ts": message.timestamp.isoformat(), "id": message.id})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(payload["ts"]), int(payload["id"])
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+
+async def create_conversation(db_session, title: Optional[str] = None) -> Conversation:
+    conversation = Conversation(title=title)
+    db_session.add(conversation)
+    await commit(db_session)
+    return conversation
+
+def get_history(db_session: Session, conversation_id: int, limit: int, cursor: Optional[str] = None) -> dict:
+    """Return one page of a conversation's messages, newest first.
+
+    Keyset pagination: each page seeks directly to the cursor position on
+    ix_messages_conversation_timestamp_id, so page N costs the same as page 1.
+    """
+    query = db_session.query(Message).filter(Message.conversation_id == conversation_id)
+    if cursor:
+        timestamp, message_id = decode_cursor(cursor)
+        query = query.filter(tuple_(Message.timestamp, Message.id) < tuple_(timestamp, message_id))
+    rows = (
+        query.order_by(Message.timestamp.desc(), Message.id.desc())
+        .limit(limit + 1)  # one extra row tells us whether another page exists
+        .all()
+    )
+    page = rows[:limit]
+    return {
+        "conversation_id": conversation_id,
+        "messages": [message_to_dict(message) for message in page],
+        "next_cursor": encode_cursor(page[-1]) if len(rows) > limit else None
+    }
@@ -0,0 +1,96 @@
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Question words and fillers carry no lexical signal and would only dilute coverage
+STOPWORDS = frozenset("""
+a about an and any are as at be can could do does for from give has have how i in is it
+its me my of on or should so tell than that the their there these this to was we what
+when where which who why will with would you your
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+class BM25Index:
+    """In-memory Okapi BM25 inverted index over a collection's documents"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.documents: Dict[str, Tuple[str, Dict[str, Any], int]] = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, ids: List[str], documents: List[str], metadatas: List[Dict[str, Any]]):
+        """Index documents; an id that is already indexed only has its metadata refreshed"""
+        with self._lock:
+            for item_id, text, metadata in zip(ids, documents, metadatas):
+                if item_id in self.documents:
+                    stored_text, _, length = self.documents[item_id]
+                    self.documents[item_id] = (stored_text, metadata, length)
+                    continue
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                self.documents[item_id] = (text, metadata, length)
+                self.total_length += length
+                for term, count in counts.items():
+                    self.postings.setdefault(term, {})[item_id] = count
+
+    def remove(self, ids: List[str]):
+        with self._lock:
+            for item_id in ids:
+                entry = self.documents.pop(item_id, None)
+                if entry is None:
+                    continue
+                self.total_length -= entry[2]
+                for term in set(tokenize(entry[0])):
+                    posting = self.postings.get(term)
+                    if posting is not None:
+                        posting.pop(item_id, None)
+                        if not posting:
+                            del self.postings[term]
+
+    def _idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log((len(self.documents) - df + 0.5) / (df + 0.5) + 1)
+
+    def search(self, query: str, n_results: int) -> Dict[str, Any]:
+        """Top documents by BM25 score, Chroma-shaped for a single query, plus a confidence.
+
+        Confidence is the IDF-weighted share of the query's terms that occur in
+        the top hit: 1.0 means every (distinctive) term of the question was
+        found in that chunk, which makes the lexical ranking trustworthy on its own.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            if not terms or not self.documents:
+                return {"ids": [[]], "documents": [[]], "metadatas": [[]], "scores": [[]], "confidence": 0.0}
+            average_length = self.total_length / len(self.documents)
+            idf = {term: self._idf(term) for term in terms}
+            scores = Counter()
+            for term in terms:
+                for item_id, tf in self.postings.get(term, {}).items():
+                    length = self.documents[item_id][2]
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[item_id] += idf[term] * tf * (self.k1 + 1) / norm
+            top = scores.most_common(n_results)
+            confidence = 0.0
+            if top:
+                matched = sum(idf[term] for term in terms if top[0][0] in self.postings.get(term, {}))
+                confidence = matched / sum(idf.values())
+            return {
+                "ids": [[item_id for item_id, _ in top]],
+                "documents": [[self.documents[item_id][0] for item_id, _ in top]],
+                "metadatas": [[self.documents[item_id][1] for item_id, _ in top]],
+                "scores": [[score for _, score in top]],
+                "confidence": confidence
+            }
@@ -1,88 +1,343 @@
-import chromadb
-from chromadb.utils import embedding_functions
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from config import Config
-from typing import List, Dict, Any
+from scheduler import retry_delay
+from typing import List, Dict, Any, Set, Tuple
+from urllib.parse import urlsplit
+from .bm25 import BM25Index
+from .embedding_cache import EmbeddingCache
+from .vector_index import VectorBackend, create_backend
+
+logger = logging.getLogger(__name__)
+
+# Serializes the lazy imports of chromadb, the provider SDKs and langchain: they all load
+# pydantic.v1, and importing it from two threads at once can see a partially initialized module
+IMPORT_LOCK = threading.RLock()
+
+class _SkipChangePolls(logging.Filter):
+    """Keeps the frequent collection listing of sync_remote_changes out of the httpx request log"""
+
+    def filter(self, record):
+        args = record.args if isinstance(record.args, tuple) else ()
+        return not (len(args) >= 2 and args[0] == "GET" and str(args[1]).endswith("/collections"))
 
 class ChromaDatabase:
     def __init__(self):
-        self.client = chromadb.PersistentClient(path=Config.CHROMADB_PATH)
-        # Update the embedding function initialization
-        self.embedding_function = embedding_functions.OpenAIEmbeddingFunction(
-            api_key=Config.OPENAI_API_KEY,
-            model_name=Config.OPENAI_EMBEDDING_MODEL,  # Use the config value
-            dimensions=1536  # Add dimensions parameter
-        )
+        # chromadb is imported and the store opened on first use (or by the startup warm-up), not at import
+        self._client = None
+        self._embedding_function = None
+        # Multi-worker mode: every worker talks to one Chroma server instead of opening the files itself
+        self.remote = bool(Config.CHROMA_SERVER_URL)
+        self._versions = {}  # collection -> change token last seen (remote mode)
+        self._unpublished = set()  # collections written here since the last publish_changes
+        if self.remote:
+            logging.getLogger("httpx").addFilter(_SkipChangePolls())
+        self.embedding_cache = EmbeddingCache(Config.EMBEDDING_CACHE_PATH, Config.OPENAI_EMBEDDING_MODEL)
+        # Collection handles are reused across requests
+        self._collections = {}
+        self._collections_lock = threading.Lock()
+        self._listeners = {}
+        self._backends = {}
+        self._lexical = {}
+        # Called with a batch's estimated tokens around each embedding request (a provider scheduler slot)
+        self.embedding_gate = lambda tokens: nullcontext()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with IMPORT_LOCK:
+                if self._client is None:
+                    import chromadb
+                    if self.remote:
+                        # One pooled keep-alive HTTP client per process
+                        url = urlsplit(Config.CHROMA_SERVER_URL)
+                        self._client = chromadb.HttpClient(
+                            host=url.hostname, port=url.port or (443 if url.scheme == "https" else 80),
+                            ssl=url.scheme == "https"
+                        )
+                    else:
+                        self._client = chromadb.PersistentClient(path=Config.CHROMADB_PATH)
+        return self._client
+
+    @property
+    def embedding_function(self):
+        if self._embedding_function is None:
+            with IMPORT_LOCK:
+                from chromadb.utils import embedding_functions
+            self._embedding_function = embedding_functions.OpenAIEmbeddingFunction(
+                api_key=Config.OPENAI_API_KEY,
+                model_name=Config.OPENAI_EMBEDDING_MODEL,  # Use the config value
+                dimensions=Config.EMBEDDING_DIMENSIONS  # Add dimensions parameter
+            )
+        return self._embedding_function
+
+    def on_change(self, collection_name: str, callback):
+        """Register a callback that runs after documents are written to a collection"""
+        self._listeners.setdefault(collection_name, []).append(callback)
+
+    def _run_listeners(self, collection_name: str):
+        for callback in self._listeners.get(collection_name, []):
+            callback()
+
+    def _notify(self, collection_name: str):
+        self._run_listeners(collection_name)
+        if self.remote:
+            self._unpublished.add(collection_name)
+
+    def publish_changes(self):
+        """Tell the other workers about this worker's writes (remote mode; once per document, not per batch).
+
+        A new token in each changed collection's metadata makes them drop what they derived from it.
+        """
+        while self._unpublished:
+            collection_name = self._unpublished.pop()
+            version = uuid.uuid4().hex
+            try:
+                self.get_collection(collection_name).modify(metadata={"version": version})
+            except Exception:
+                self._unpublished.add(collection_name)  # retried with the next document
+                raise
+            self._versions[collection_name] = version
+
+    def sync_remote_changes(self) -> List[str]:
+        """Invalidate local state for collections other workers wrote to; returns their names"""
+        changed = []
+        for collection in self.client.list_collections():
+            if collection.name not in self._versions:
+                continue  # not opened here, so nothing is cached
+            version = (collection.metadata or {}).get("version")
+            if version != self._versions[collection.name]:
+                self._versions[collection.name] = version
+                self._lexical.pop(collection.name, None)  # rebuilt from the collection on next use
+                self._run_listeners(collection.name)
+                changed.append(collection.name)
+        return changed
 
     def get_collection(self, collection_name: str):
         """Get or create a collection with the specified name"""
-        try:
-            return self.client.get_or_create_collection(
-                name=collection_name,
-                embedding_function=self.embedding_function
+        collection = self._collections.get(collection_name)
+        if collection is not None:
+            return collection
+        # Chroma's first-use segment setup isn't thread-safe, and searches run in worker threads
+        with self._collections_lock:
+            collection = self._collections.get(collection_name)
+            if collection is not None:
+                return collection
+            try:
+                collection = self.client.get_or_create_collection(
+                    name=collection_name,
+                    embedding_function=self.embedding_function
+                )
+                self._collections[collection_name] = collection
+                if self.remote:
+                    self._versions[collection_name] = (collection.metadata or {}).get("version")
+                return collection
+            except Exception as e:
+                logger.exception("Error creating collection: %s", e)
+                raise
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed one batch, retrying with exponential backoff (or as long as Retry-After asks)"""
+        tokens = sum(len(text) for text in texts) // Config.CONTEXT_CHARS_PER_TOKEN
+        for attempt in range(Config.EMBEDDING_MAX_RETRIES + 1):
+            try:
+                with self.embedding_gate(tokens):
+                    return [list(map(float, vector)) for vector in self.embedding_function(texts)]
+            except Exception as e:
+                if attempt == Config.EMBEDDING_MAX_RETRIES:
+                    raise
+                delay = retry_delay(e, attempt, Config.EMBEDDING_RETRY_BACKOFF)
+                logger.warning("Embedding batch failed (%s), retrying in %.1fs", e, delay)
+                time.sleep(delay)
+
+    def _batches(self, texts: List[str]) -> List[List[int]]:
+        """Group text indexes into batches bounded by item count and total characters"""
+        batches, current, current_chars = [], [], 0
+        for index, text in enumerate(texts):
+            if current and (len(current) >= Config.EMBEDDING_BATCH_SIZE
+                            or current_chars + len(text) > Config.EMBEDDING_BATCH_MAX_CHARS):
+                batches.append(current)
+                current, current_chars = [], 0
+            current.append(index)
+            current_chars += len(text)
+        if current:
+            batches.append(current)
+        return batches
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, reusing cached vectors and embedding the rest in concurrent batches"""
+        hashes = [self.content_hash(text) for text in texts]
+        vectors = self.embedding_cache.get_many(hashes)
+        missing = {}
+        for text, content_hash in zip(texts, hashes):
+            if content_hash not in vectors:
+                missing.setdefault(content_hash, text)
+
+        if missing:
+            missing_hashes = list(missing.keys())
+            missing_texts = list(missing.values())
+            batches = self._batches(missing_texts)
+            with ThreadPoolExecutor(max_workers=Config.EMBEDDING_CONCURRENCY) as executor:
+                results = executor.map(
+                    lambda batch: self._embed_batch([missing_texts[i] for i in batch]),
+                    batches
+                )
+                for batch, batch_vectors in zip(batches, results):
+                    embedded = {missing_hashes[i]: vector for i, vector in zip(batch, batch_vectors)}
+                    # Persist per batch so a failed run keeps the work already paid for
+                    self.embedding_cache.put_many(embedded)
+                    vectors.update(embedded)
+            logger.info("Embedded %d new texts in %d batches (%d served from cache)",
+                        len(missing), len(batches), len(texts) - len(missing))
+
+        return [vectors[content_hash] for content_hash in hashes]
+
+    def upsert_documents(self, collection_name: str, namespace: str,
+                         items: List[Tuple[str, Dict[str, Any]]]) -> Tuple[List[str], List[str]]:
+        """Add (text, metadata) items under content-hash ids, embedding only ids not already stored.
+
+        Returns (all item ids, ids newly added by this call).
+        """
+        collection = self.get_collection(collection_name)
+        documents, metadatas, ids = [], [], []
+        seen = set()
+        for text, metadata in items:
+            item_id = f"{namespace}:{self.content_hash(text)}"
+            if item_id in seen:  # identical text twice in one document
+                continue
+            seen.add(item_id)
+            documents.append(text)
+            metadatas.append({**metadata, "namespace": namespace})
+            ids.append(item_id)
+        if not ids:
+            return [], []
+
+        existing = set(collection.get(ids=ids, include=[])["ids"])
+        if existing:
+            # Same content, possibly at a new position: refresh metadata without re-embedding
+            collection.update(
+                ids=[item_id for item_id in ids if item_id in existing],
+                metadatas=[metadata for item_id, metadata in zip(ids, metadatas) if item_id in existing]
             )
-        except Exception as e:
-            print(f"Error creating collection: {str(e)}")
-            raise
 
-    def add_pages(self, collection_name: str, pages: List[Any]):
-        """Add PDF pages to the specified collection"""
+        new = [i for i, item_id in enumerate(ids) if item_id not in existing]
+        if new:
+            new_documents = [documents[i] for i in new]
+            embeddings = self.embed_documents(new_documents)
+            for start in range(0, len(new), Config.CHROMA_WRITE_BATCH_SIZE):
+                batch = new[start:start + Config.CHROMA_WRITE_BATCH_SIZE]
+                collection.add(
+                    documents=[documents[i] for i in batch],
+                    metadatas=[metadatas[i] for i in batch],
+                    embeddings=embeddings[start:start + len(batch)],
+                    ids=[ids[i] for i in batch]
+                )
+            self._notify(collection_name)
+        lexical = self._lexical.get(collection_name)
+        if lexical is not None:
+            # Keep a loaded lexical index in step with the collection (existing ids only get new metadata)
+            lexical.add(ids, documents, metadatas)
+        logger.info("Collection %s: %d added, %d unchanged (%s)", collection_name, len(new), len(existing), namespace)
+        return ids, [ids[i] for i in new]
+
+    def prune(self, collection_name: str, namespace: str, keep_ids: Set[str]) -> int:
+        """Delete a namespace's entries that are no longer part of the document"""
+        collection = self.get_collection(collection_name)
+        stored = collection.get(where={"namespace": namespace}, include=[])["ids"]
+        stale = [item_id for item_id in stored if item_id not in keep_ids]
+        if stale:
+            collection.delete(ids=stale)
+            if collection_name in self._lexical:
+                self._lexical[collection_name].remove(stale)
+            self._notify(collection_name)
+            logger.info("Removed %d stale entries from collection %s (%s)", len(stale), collection_name, namespace)
+        return len(stale)
+
+    def discard(self, collection_name: str, ids: List[str]):
+        """Delete entries added by an ingestion that was cancelled or failed"""
+        if not ids:
+            return
+        self.get_collection(collection_name).delete(ids=ids)
+        if collection_name in self._lexical:
+            self._lexical[collection_name].remove(ids)
+        self._notify(collection_name)
+        logger.info("Discarded %d entries from collection %s", len(ids), collection_name)
+
+    def get_backend(self, collection_name: str) -> VectorBackend:
+        """Search backend for a collection, chosen by Config.VECTOR_BACKEND"""
+        backend = self._backends.get(collection_name)
+        if backend is None:
+            name = Config.VECTOR_BACKEND
+            if self.remote and name != "chroma":
+                # In-process indexes would be built and rebuilt by every worker over the same files
+                logger.warning("VECTOR_BACKEND=%s ignored: with CHROMA_SERVER_URL the Chroma server searches", name)
+                name = "chroma"
+            backend = create_backend(name, self.get_collection(collection_name), Config.VECTOR_INDEX_PATH)
+            self._backends[collection_name] = backend
+            self.on_change(collection_name, backend.invalidate)
+        return backend
+
+    def query(self, collection_name: str, query_embeddings: List[List[float]], n_results: int) -> Dict[str, List[List[Any]]]:
+        """Nearest-neighbour search; results have Chroma's shape (ids, documents, metadatas, distances)"""
+        return self.get_backend(collection_name).query(query_embeddings, n_results)
+
+    def get_lexical_index(self, collection_name: str) -> BM25Index:
+        """BM25 index over a collection's documents, built from the collection on first use"""
+        index = self._lexical.get(collection_name)
+        if index is None:
+            data = self.get_collection(collection_name).get(include=["documents", "metadatas"])
+            index = BM25Index()
+            index.add(data["ids"], data["documents"], data["metadatas"])
+            # setdefault: two threads may build concurrently, both keep the same index afterwards
+            index = self._lexical.setdefault(collection_name, index)
+        return index
+
+    def lexical_search(self, collection_name: str, query: str, n_results: int) -> Dict[str, Any]:
+        """BM25 search; results have Chroma's shape plus scores and a confidence in [0, 1]"""
+        return self.get_lexical_index(collection_name).search(query, n_results)
+
+    def add_pages(self, collection_name: str, pages: List[Any], namespace: str,
+                  start_index: int = 0) -> Tuple[List[str], List[str]]:
+        """Add PDF pages to the specified collection (start_index offsets page numbering for batched calls)"""
         try:
-            collection = self.get_collection(collection_name)
-            documents = []
-            metadatas = []
-            ids = []
-            
+            items = []
             for i, page in enumerate(pages):
                 # Clean and validate the text
                 text = str(page.page_content).strip()
                 if text:  # Only add non-empty documents
-                    documents.append(text)
-                    metadatas.append({
+                    items.append((text, {
                         "source": str(page.metadata.get("source", "")),
-                        "page": i + 1
-                    })
-                    ids.append(f"page_{i + 1}")
-            
-            if documents:  # Only add if we have valid documents
-                collection.add(
-                    documents=documents,
-                    metadatas=metadatas,
-                    ids=ids
-                )
-                print(f"Added {len(documents)} pages to collection {collection_name}")
-            return collection.peek()
+                        "page": start_index + i + 1
+                    }))
+            return self.upsert_documents(collection_name, namespace, items)
         except Exception as e:
-            print(f"Error adding pages: {str(e)}")
+            logger.exception("Error adding pages: %s", e)
             raise
 
-    def add_chunks(self, collection_name: str, chunks: List[Any]):
-        """Add text chunks to the specified collection"""
+    def add_chunks(self, collection_name: str, chunks: List[Any], namespace: str,
+                   start_index: int = 0) -> Tuple[List[str], List[str]]:
+        """Add text chunks to the specified collection (start_index offsets chunk numbering for batched calls)"""
         try:
-            collection = self.get_collection(collection_name)
-            documents = []
-            metadatas = []
-            ids = []
-            
+            items = []
             for i, chunk in enumerate(chunks):
                 # Clean and validate the text
                 text = str(chunk.page_content).strip()
                 if text:  # Only add non-empty documents
-                    documents.append(text)
-                    metadatas.append({
+                    items.append((text, {
                         "source": str(chunk.metadata.get("source", "")),
                         "page": chunk.metadata.get("page", 0),
-                        "chunk": i + 1
-                    })
-                    ids.append(f"chunk_{i + 1}")
-            
-            if documents:  # Only add if we have valid documents
-                collection.add(
-                    documents=documents,
-                    metadatas=metadatas,
-                    ids=ids
-                )
-                print(f"Added {len(documents)} chunks to collection {collection_name}")
-            return collection.peek()
+                        "chunk": start_index + i + 1
+                    }))
+            return self.upsert_documents(collection_name, namespace, items)
         except Exception as e:
-            print(f"Error adding chunks: {str(e)}")
-            raise
\ No newline at end of file
+            logger.exception("Error adding chunks: %s", e)
+            raise
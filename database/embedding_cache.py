@@ -0,0 +1,61 @@
+import os
+import sqlite3
+import threading
+from array import array
+from typing import Dict, List, Sequence
+
+class EmbeddingCache:
+    """Persistent content-hash -> embedding vector cache (SQLite file)"""
+
+    def __init__(self, path: str, model: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.model = model or ""
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, content_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, content_hash))"
+        )
+        self._conn.commit()
+
+    def get_many(self, hashes: Sequence[str]) -> Dict[str, List[float]]:
+        """Return cached vectors for the given hashes (missing hashes are omitted)"""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT content_hash, vector FROM embeddings WHERE model = ? AND content_hash IN ({placeholders})",
+                    [self.model, *batch]
+                ).fetchall()
+                for content_hash, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[content_hash] = vector.tolist()
+        return found
+
+    def put_many(self, vectors: Dict[str, Sequence[float]]):
+        """Store vectors keyed by content hash"""
+        if not vectors:
+            return
+        rows = [
+            (self.model, content_hash, array("f", [float(x) for x in vector]).tobytes())
+            for content_hash, vector in vectors.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, content_hash, vector) VALUES (?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
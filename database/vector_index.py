@@ -0,0 +1,202 @@
+import json
+import os
+import threading
+from typing import Any, Dict, List
+import numpy as np
+from config import Config
+
+# Every backend reports distances as squared L2 between unit vectors (2 - 2 * cosine),
+# which is what Chroma's default "l2" space returns for normalized OpenAI embeddings.
+
+def _empty_result(query_count: int) -> Dict[str, List[List[Any]]]:
+    return {key: [[] for _ in range(query_count)] for key in ("ids", "documents", "metadatas", "distances")}
+
+class VectorBackend:
+    """Similarity search over one collection's stored embeddings"""
+
+    name = "base"
+
+    def query(self, query_embeddings: List[List[float]], n_results: int) -> Dict[str, List[List[Any]]]:
+        """Return Chroma-shaped results: ids, documents, metadatas and distances per query"""
+        raise NotImplementedError
+
+    def invalidate(self):
+        """Called after the underlying collection changed"""
+
+    def warm(self):
+        """Load whatever the first query would otherwise load (called by the startup warm-up)"""
+
+class ChromaBackend(VectorBackend):
+    """Query the Chroma collection directly (on-disk HNSW, SQLite metadata)"""
+
+    name = "chroma"
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def query(self, query_embeddings, n_results):
+        return self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            include=["documents", "metadatas", "distances"]
+        )
+
+class IndexSnapshot:
+    """One loaded index: the matrix, its rows' ids, documents and metadatas, and a subclass's extra
+    structure. Never modified; a reload publishes a new one, so a query holding it reads one consistent set."""
+
+    def __init__(self, matrix: np.ndarray, ids: list, documents: list, metadatas: list, extra: Any = None):
+        self.matrix = matrix
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.extra = extra
+
+class NumpyBackend(VectorBackend):
+    """Exact search over an in-memory matrix, exported from Chroma and memory-mapped from disk"""
+
+    name = "numpy"
+
+    def __init__(self, collection, index_dir: str):
+        self.collection = collection
+        self.base_path = os.path.join(index_dir, collection.name)
+        os.makedirs(index_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._snapshot = None  # IndexSnapshot; None until loaded and after invalidate
+
+    @property
+    def _matrix_path(self):
+        return self.base_path + ".npy"
+
+    @property
+    def _meta_path(self):
+        return self.base_path + ".meta.json"
+
+    def _index_files(self):
+        return [self._matrix_path, self._meta_path]
+
+    def _export(self):
+        """Write the collection's normalized embeddings and metadata to the index files"""
+        data = self.collection.get(include=["embeddings", "documents", "metadatas"])
+        embeddings = data["embeddings"]
+        if embeddings is None or len(embeddings) == 0:
+            matrix = np.zeros((0, Config.EMBEDDING_DIMENSIONS), dtype=np.float32)
+        else:
+            matrix = np.asarray(embeddings, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms == 0, 1, norms)
+        # Write to temporary names and rename, so a crash never leaves a half-written index
+        np.save(self._matrix_path + ".tmp.npy", matrix)
+        with open(self._meta_path + ".tmp", "w") as f:
+            json.dump({"ids": data["ids"], "documents": data["documents"], "metadatas": data["metadatas"]}, f)
+        os.replace(self._matrix_path + ".tmp.npy", self._matrix_path)
+        os.replace(self._meta_path + ".tmp", self._meta_path)
+        return matrix
+
+    def _build_extra(self, matrix: np.ndarray):
+        """Hook for subclasses that persist an additional structure over the matrix"""
+
+    def _load_extra(self, matrix: np.ndarray):
+        """Hook for subclasses that load the structure written by _build_extra; returns it"""
+
+    def _ensure_loaded(self) -> IndexSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        with self._lock:
+            if self._snapshot is not None:
+                return self._snapshot
+            if not all(os.path.exists(path) for path in self._index_files()):
+                self._build_extra(self._export())
+            # Memory-mapped: startup only maps the file, pages are read on first use
+            matrix = np.load(self._matrix_path, mmap_mode="r")
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+            # Published in one assignment: queries never pair a new matrix with old ids
+            self._snapshot = IndexSnapshot(matrix, meta["ids"], meta["documents"], meta["metadatas"],
+                                           self._load_extra(matrix))
+            return self._snapshot
+
+    def warm(self):
+        self._ensure_loaded()
+
+    def invalidate(self):
+        # Removing the files marks the persisted index stale for this and future processes;
+        # queries already holding the old snapshot finish on it
+        with self._lock:
+            self._snapshot = None
+            for path in self._index_files():
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _search(self, snapshot: IndexSnapshot, queries: np.ndarray, k: int):
+        similarities = queries @ snapshot.matrix.T
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        for row, candidates in enumerate(top):
+            order = candidates[np.argsort(-similarities[row, candidates])]
+            yield order, 2.0 - 2.0 * similarities[row, order]
+
+    def query(self, query_embeddings, n_results):
+        snapshot = self._ensure_loaded()
+        if len(snapshot.ids) == 0:
+            return _empty_result(len(query_embeddings))
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        k = min(n_results, len(snapshot.ids))
+        result = _empty_result(len(query_embeddings))
+        for row, (indexes, distances) in enumerate(self._search(snapshot, queries, k)):
+            result["ids"][row] = [snapshot.ids[i] for i in indexes]
+            result["documents"][row] = [snapshot.documents[i] for i in indexes]
+            result["metadatas"][row] = [snapshot.metadatas[i] for i in indexes]
+            result["distances"][row] = [float(d) for d in distances]
+        return result
+
+class HnswBackend(NumpyBackend):
+    """Approximate search with an hnswlib graph built over the same exported matrix"""
+
+    name = "hnsw"
+
+    def __init__(self, collection, index_dir: str):
+        super().__init__(collection, index_dir)
+        import hnswlib  # optional, ships with chroma-hnswlib
+        self._hnswlib = hnswlib
+
+    @property
+    def _graph_path(self):
+        return self.base_path + ".hnsw.bin"
+
+    def _index_files(self):
+        return super()._index_files() + [self._graph_path]
+
+    def _build_extra(self, matrix):
+        graph = self._hnswlib.Index(space="ip", dim=matrix.shape[1])
+        graph.init_index(max_elements=max(len(matrix), 1), ef_construction=Config.HNSW_EF_CONSTRUCTION, M=Config.HNSW_M)
+        if len(matrix):
+            graph.add_items(matrix, np.arange(len(matrix)))
+        graph.save_index(self._graph_path + ".tmp")
+        os.replace(self._graph_path + ".tmp", self._graph_path)
+
+    def _load_extra(self, matrix):
+        graph = self._hnswlib.Index(space="ip", dim=matrix.shape[1])
+        graph.load_index(self._graph_path)
+        graph.set_ef(Config.HNSW_EF_SEARCH)  # hnswlib searches with max(ef, k)
+        return graph
+
+    def _search(self, snapshot, queries, k):
+        labels, distances = snapshot.extra.knn_query(queries, k=k)
+        for row in range(len(queries)):
+            # hnswlib "ip" distance is 1 - dot; convert to squared L2 between unit vectors
+            yield labels[row], 2.0 * distances[row]
+
+BACKENDS = {
+    "chroma": ChromaBackend,
+    "numpy": NumpyBackend,
+    "hnsw": HnswBackend,
+}
+
+def create_backend(name: str, collection, index_dir: str) -> VectorBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown vector backend '{name}', expected one of {', '.join(BACKENDS)}")
+    if name == "chroma":
+        return ChromaBackend(collection)
+    return BACKENDS[name](collection, index_dir)
@@ -1,15 +1,81 @@
-from sqlalchemy import create_engine
+import asyncio
+import inspect
+import logging
+from sqlalchemy import create_engine, event, inspect as inspect_schema, make_url, text
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateIndex
 from models import Base
 from config import Config
 
-SQLALCHEMY_DATABASE_URL = Config.SQLALCHEMY_DATABASE_URL
+logger = logging.getLogger(__name__)
+
+# Async drivers used for DB_ASYNC with a plain URL (sqlite:///..., postgresql://...)
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+def _driver_urls(url: str):
+    """(sync URL, async URL, whether the configured URL names an async driver)"""
+    scheme, rest = url.split("://", 1)
+    dialect, _, driver = scheme.partition("+")
+    if driver in ASYNC_DRIVERS.values():
+        return f"{dialect}://{rest}", url, True
+    if dialect not in ASYNC_DRIVERS:
+        return url, None, False
+    return url, f"{dialect}+{ASYNC_DRIVERS[dialect]}://{rest}", False
+
+SQLALCHEMY_DATABASE_URL, ASYNC_DATABASE_URL, _ASYNC_URL = _driver_urls(Config.SQLALCHEMY_DATABASE_URL)
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+# In-memory SQLite (sqlite://, :memory:) gets a SingletonThreadPool/StaticPool, which takes no pool sizing
+_database = make_url(SQLALCHEMY_DATABASE_URL).database
+IS_SQLITE_MEMORY = IS_SQLITE and (not _database or _database == ":memory:" or "mode=memory" in SQLALCHEMY_DATABASE_URL)
+# The message and document paths use AsyncSession when asked to, or when the URL names an async driver
+USE_ASYNC = (Config.DB_ASYNC or _ASYNC_URL) and ASYNC_DATABASE_URL is not None
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run alongside the single writer; NORMAL sync is durable across app crashes in WAL mode
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={Config.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={int(Config.SQLITE_BUSY_TIMEOUT * 1000)}")
+    cursor.execute(f"PRAGMA cache_size=-{Config.SQLITE_CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def _engine_options() -> dict:
+    if IS_SQLITE_MEMORY:
+        return {"connect_args": {"check_same_thread": False}}
+    if IS_SQLITE:
+        return {
+            "connect_args": {"check_same_thread": False, "timeout": Config.SQLITE_BUSY_TIMEOUT},
+            "pool_size": Config.DB_POOL_SIZE,
+            "max_overflow": Config.DB_MAX_OVERFLOW
+        }
+    return {"pool_size": Config.DB_POOL_SIZE, "max_overflow": Config.DB_MAX_OVERFLOW, "pool_pre_ping": True}
+
+# The sync engine always exists: schema setup, job bookkeeping, the write-behind thread and the other endpoints use it
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_options())
+if IS_SQLITE:
+    event.listen(engine, "connect", _set_sqlite_pragmas)
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = None
+AsyncSessionLocal = None
+if USE_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+    async_options = _engine_options()
+    if IS_SQLITE_MEMORY:
+        async_options = {}
+    elif IS_SQLITE:
+        # aiosqlite would default to opening a connection per checkout; pool them like the sync engine
+        async_options.update(connect_args={"timeout": Config.SQLITE_BUSY_TIMEOUT}, poolclass=AsyncAdaptedQueuePool)
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **async_options)
+    if IS_SQLITE:
+        event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    # Objects stay readable after commit: an expired attribute can't be reloaded lazily under asyncio
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Database dependency
 def get_db():
     db = SessionLocal()
@@ -18,5 +84,124 @@ def get_db():
     finally:
         db.close()
 
+def new_session():
+    """Session for the message and document paths: an AsyncSession with DB_ASYNC, else a sync Session"""
+    return AsyncSessionLocal() if USE_ASYNC else SessionLocal()
+
+async def get_session():
+    session = new_session()
+    try:
+        yield session
+    finally:
+        await close(session)
+
+# Awaitable session operations that work on either kind of session. With a sync
+# Session they run inline (blocking, exactly as before); with an AsyncSession they
+# wait on the driver without blocking the event loop.
+
+# SQLite has a single writer. Async sessions queue here, from their first write to
+# commit or rollback, instead of colliding on the file lock and backing off through
+# busy_timeout sleeps. Sync sessions bypass this lock, so while the app serves
+# requests they only write from worker threads (the message writer): one committing
+# on the event loop would wait out busy_timeout on the file lock an async session
+# holds, and that session can't commit until the loop is free again.
+_sqlite_writer = asyncio.Lock() if USE_ASYNC and IS_SQLITE else None
+
+async def _begin_write(session):
+    # Only AsyncSessions have sync_session
+    if _sqlite_writer is not None and hasattr(session, "sync_session") and not session.info.get("writing"):
+        await _sqlite_writer.acquire()
+        session.info["writing"] = True
+
+def _end_write(session):
+    if _sqlite_writer is not None and session.info.pop("writing", False):
+        _sqlite_writer.release()
+
+async def _call(session, method: str, *args, **kwargs):
+    result = getattr(session, method)(*args, **kwargs)
+    return await result if inspect.isawaitable(result) else result
+
+async def commit(session):
+    await _begin_write(session)
+    try:
+        await _call(session, "commit")
+    finally:
+        _end_write(session)
+
+async def rollback(session):
+    try:
+        await _call(session, "rollback")
+    finally:
+        _end_write(session)
+
+async def close(session):
+    try:
+        await _call(session, "close")
+    finally:
+        _end_write(session)
+
+async def execute(session, statement, params=None):
+    if getattr(statement, "is_dml", False):
+        await _begin_write(session)
+    return await _call(session, "execute", statement, params)
+
+async def get(session, model, ident):
+    return await _call(session, "get", model, ident)
+
+def _add_missing_columns(connection):
+    """ALTER TABLE ... ADD COLUMN for model columns an existing table lacks (added since it was created)"""
+    inspector = inspect_schema(connection)
+    tables = set(inspector.get_table_names())
+    preparer = connection.dialect.identifier_preparer
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            # New columns are nullable, so existing rows need no default
+            ddl = f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} " \
+                  f"{column.type.compile(dialect=connection.dialect)}"
+            for foreign_key in column.foreign_keys:
+                target = foreign_key.column
+                ddl += f" REFERENCES {preparer.format_table(target.table)} ({preparer.format_column(target)})"
+            connection.execute(text(ddl))
+            logger.info("Added column %s.%s", table.name, column.name)
+
+def _create_missing_indexes(connection):
+    """CREATE INDEX IF NOT EXISTS for model indexes an existing table lacks (create_all only indexes new tables)"""
+    inspector = inspect_schema(connection)
+    tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                # Builds the index over every existing row: one slow start on a large table
+                logger.info("Creating index %s on %s", index.name, table.name)
+                connection.execute(CreateIndex(index, if_not_exists=True))
+
+def migrate(connection):
+    """Create missing tables, columns and indexes; safe to run on every start"""
+    Base.metadata.create_all(connection)
+    _add_missing_columns(connection)
+    _create_missing_indexes(connection)
+
+def migrate_sync():
+    with engine.begin() as connection:
+        migrate(connection)
+
 async def init_db():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    """Create or upgrade the schema (see migrate)"""
+    if async_engine is not None:
+        async with async_engine.begin() as connection:
+            await connection.run_sync(migrate)
+    else:
+        await asyncio.to_thread(migrate_sync)
+
+async def dispose_engines():
+    if async_engine is not None:
+        await async_engine.dispose()
+    engine.dispose()
@@ -1,66 +1,217 @@
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from database.chroma_client import ChromaDatabase
+import asyncio
+import logging
+from concurrent.futures import Executor
+from database.chroma_client import IMPORT_LOCK, ChromaDatabase
 from models import Document, DocumentPage
+from pdf_parser import count_pages, iter_page_ranges
+from sqlalchemy import delete, insert, inspect
 from sqlalchemy.orm import Session
+from typing import TYPE_CHECKING, List, Union
+from db import commit, execute, rollback
+from telemetry import span
 from config import Config
-import os
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+class IngestionCancelled(Exception):
+    """Raised when an ingestion job is cancelled between stages"""
+
+class NullProgress:
+    """Progress sink used when a document is processed outside of a job"""
+
+    async def update(self, **fields):
+        pass
+
+    async def check_cancelled(self):
+        pass
 
 class DocumentProcessor:
-    def __init__(self, db_session: Session):
+    def __init__(self, db_session: Union[Session, "AsyncSession"], chroma_db: ChromaDatabase, parse_pool: Executor):
         self.db_session = db_session
-        self.chroma_db = ChromaDatabase()
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=Config.CHUNK_SIZE,
-            chunk_overlap=Config.CHUNK_OVERLAP,
-            length_function=len,
-            is_separator_regex=False,
-        )
-
-    async def process_document(self, file_path: str, title: str):
-        """Process PDF document and store in both SQL and ChromaDB"""
+        self.chroma_db = chroma_db
+        self.parse_pool = parse_pool
+        self._text_splitter = None
+
+    @property
+    def text_splitter(self):
+        # langchain is slow to import, and only ingestion needs it
+        if self._text_splitter is None:
+            with IMPORT_LOCK:
+                from langchain.text_splitter import RecursiveCharacterTextSplitter
+            self._text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=Config.CHUNK_SIZE,
+                chunk_overlap=Config.CHUNK_OVERLAP,
+                length_function=len,
+                is_separator_regex=False,
+            )
+        return self._text_splitter
+
+    def _load_langchain(self):
+        """Import langchain; returns its Document class and the text splitter"""
+        with IMPORT_LOCK:
+            from langchain_core.documents import Document as LangchainDocument
+        return LangchainDocument, self.text_splitter
+
+    async def process_document(self, file_path: str, title: str, progress=None):
+        """Process PDF document and store in both SQL and ChromaDB.
+
+        Page ranges are parsed in the process pool and streamed through the
+        splitter; pages and chunks reach SQL and ChromaDB in bounded batches,
+        so memory stays flat as documents grow.
+        """
+        # The first import of langchain takes a while (and may wait on IMPORT_LOCK): keep it off the event loop
+        LangchainDocument, text_splitter = await asyncio.to_thread(self._load_langchain)
+        progress = progress or NullProgress()
+        document = None
+        # Vector entries this run added (not ones already stored), removed again if the job doesn't finish
+        added = {"document_pages": [], "document_chunks": []}
+        committed = False
         try:
-            # 1. Create document record in SQL
+            page_count = await asyncio.to_thread(count_pages, file_path)
+            await progress.update(stage="parsing", pages_total=page_count)
+            # Load the BM25 index up front so every chunk stored below is indexed as it lands
+            await asyncio.to_thread(self.chroma_db.get_lexical_index, "document_chunks")
+
+            # 1. Create document record in SQL; it stays unprocessed until every batch is stored
             document = Document(
                 title=title,
                 file_path=Config.PDF_STORAGE_PATH,
                 is_processed=False
             )
             self.db_session.add(document)
-            self.db_session.flush()
+            await commit(self.db_session)
 
-            # 2. Load and process PDF
-            loader = PyPDFLoader(file_path)
-            pages = loader.load()
+            page_ids, chunk_ids = set(), set()
+            pending_chunks = []
+            pages_processed = chunks_processed = 0
 
-            # 3. Store pages in SQL
-            for page_number, page in enumerate(pages, 1):
-                doc_page = DocumentPage(
-                    document_id=document.id,
-                    page_number=page_number,
-                    content=str(page.page_content),
-                    is_processed=True
-                )
-                self.db_session.add(doc_page)
+            async def flush_chunks():
+                nonlocal chunks_processed
+                batch = pending_chunks[:]
+                pending_chunks.clear()
+                with span("ingest.embed_chunks"):
+                    chunk_ids.update(await self._store(
+                        added["document_chunks"], self.chroma_db.add_chunks, "document_chunks", batch, title,
+                        chunks_processed
+                    ))
+                chunks_processed += len(batch)
+                await progress.update(chunks_total=chunks_processed, chunks_embedded=chunks_processed)
 
-            # 4. Store in ChromaDB for vector search
-            self.chroma_db.add_pages("document_pages", pages)
+            # 2. Load and process PDF, one page range at a time
+            async for parsed in iter_page_ranges(file_path, self.parse_pool, page_count):
+                pages = [
+                    LangchainDocument(page_content=text, metadata={"source": file_path, "page": index})
+                    for index, text in parsed
+                ]
 
-            # 5. Create and store chunks for RAG
-            chunks = self.text_splitter.split_documents(pages)
-            self.chroma_db.add_chunks("document_chunks", chunks)
+                # 3. Store pages in SQL (one bulk insert and short transaction per batch)
+                with span("ingest.store_pages"):
+                    await execute(self.db_session, insert(DocumentPage), [
+                        {
+                            "document_id": document.id,
+                            "page_number": index + 1,
+                            "content": text,
+                            "is_processed": True
+                        }
+                        for index, text in parsed
+                    ])
+                    await commit(self.db_session)
+
+                # 4. Store in ChromaDB for vector search (namespaced per document, unchanged content is skipped)
+                with span("ingest.embed_pages"):
+                    page_ids.update(await self._store(
+                        added["document_pages"], self.chroma_db.add_pages, "document_pages", pages, title,
+                        pages_processed
+                    ))
+                pages_processed += len(pages)
+                await progress.update(stage="embedding", pages_parsed=pages_processed)
+
+                # 5. Create chunks for RAG and hand them on in bounded batches
+                with span("ingest.split"):
+                    pending_chunks.extend(text_splitter.split_documents(pages))
+                while len(pending_chunks) >= Config.INGEST_BATCH_SIZE:
+                    await flush_chunks()
+                await progress.check_cancelled()
+
+            if pending_chunks:
+                await flush_chunks()
+
+            # Drop entries from a previous version of this document
+            with span("ingest.prune"):
+                await asyncio.to_thread(self.chroma_db.prune, "document_pages", title, page_ids)
+                await asyncio.to_thread(self.chroma_db.prune, "document_chunks", title, chunk_ids)
 
             # 6. Mark document as processed
-            document.is_processed = True
-            self.db_session.commit()
+            await progress.update(stage="committing")
+            with span("ingest.commit"):
+                document.is_processed = True
+                await commit(self.db_session)
+            committed = True
+            await self._publish_changes()
+            await progress.update(committed=True, document_id=document.id)
 
             return {
                 "status": "success",
                 "document_id": document.id,
-                "pages_processed": len(pages),
-                "chunks_processed": len(chunks)
+                "pages_processed": pages_processed,
+                "chunks_processed": chunks_processed
             }
 
+        except IngestionCancelled:
+            await self._discard(document, added)
+            raise
+        except asyncio.CancelledError:
+            # Server shutdown: clean up before letting the cancellation through, or the partial
+            # document would stay searchable
+            if not committed:
+                cleanup = asyncio.ensure_future(self._discard(document, added))
+                try:
+                    await asyncio.shield(cleanup)
+                except asyncio.CancelledError:
+                    await cleanup
+            raise
         except Exception as e:
-            self.db_session.rollback()
-            raise Exception(f"Error processing document: {str(e)}")
\ No newline at end of file
+            await self._discard(document, added)
+            raise Exception(f"Error processing document: {str(e)}")
+
+    async def _store(self, added: list, add, *args) -> List[str]:
+        """Run add_pages/add_chunks in a thread; returns the item ids and records the newly added ones in added.
+
+        If the job is cancelled meanwhile, the write is still awaited so its ids can be discarded.
+        """
+        write = asyncio.ensure_future(asyncio.to_thread(add, *args))
+        try:
+            ids, new_ids = await asyncio.shield(write)
+        except asyncio.CancelledError:
+            ids, new_ids = await write
+            added.extend(new_ids)
+            raise
+        added.extend(new_ids)
+        return ids
+
+    async def _publish_changes(self):
+        """Let the other workers see this document's writes; a failure only delays that, so it is logged"""
+        try:
+            await asyncio.to_thread(self.chroma_db.publish_changes)
+        except Exception as e:
+            logger.warning("Publishing collection changes failed: %s", e)
+
+    async def _discard(self, document: Document, added: dict):
+        """Remove a partially stored document: the vectors and BM25 entries it added, then its SQL rows"""
+        for collection_name, ids in added.items():
+            try:
+                await asyncio.to_thread(self.chroma_db.discard, collection_name, ids)
+            except Exception as e:
+                logger.exception("Error discarding %d entries from %s: %s", len(ids), collection_name, e)
+        await self._publish_changes()
+        await rollback(self.db_session)
+        # The identity survives the rollback without a reload (which an AsyncSession can't do lazily)
+        identity = inspect(document).identity if document is not None else None
+        if not identity:
+            return
+        await execute(self.db_session, delete(DocumentPage).where(DocumentPage.document_id == identity[0]))
+        await execute(self.db_session, delete(Document).where(Document.id == identity[0]))
+        await commit(self.db_session)
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import os
+import uuid
+from concurrent.futures import Executor
+from typing import Optional
+from database.chroma_client import ChromaDatabase
+from document_processor import DocumentProcessor, IngestionCancelled
+from models import IngestionJob
+from db import SessionLocal, close, commit, get, new_session
+from scheduler import INGEST, request_priority
+from telemetry import span
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, owned by another user
+    return True
+
+def fail_interrupted_jobs(orphaned_only: bool = False):
+    """Mark queued and running jobs failed: their worker is gone.
+
+    The launcher of several app workers fails all of them once, before the
+    workers start. Each worker then only fails jobs whose worker process has
+    exited (uvicorn restarting a crashed worker); failing the rest would fail
+    jobs other workers are still running.
+    """
+    db = SessionLocal()
+    try:
+        jobs = db.query(IngestionJob).filter(IngestionJob.status.in_(["queued", "running"]))
+        if orphaned_only:
+            ids = [job_id for job_id, pid in jobs.with_entities(IngestionJob.id, IngestionJob.worker_pid)
+                   if pid is None or not _process_alive(pid)]
+            if not ids:
+                return
+            jobs = db.query(IngestionJob).filter(IngestionJob.id.in_(ids))
+        count = jobs.update(
+            {"status": "failed", "error": "Interrupted by server restart"},
+            synchronize_session=False
+        )
+        db.commit()
+        if count:
+            logger.info("Marked %d interrupted ingestion jobs failed", count)
+    finally:
+        db.close()
+
+class QueueFull(Exception):
+    """Raised when the ingestion queue has no room for another job"""
+
+def job_to_dict(job: IngestionJob) -> dict:
+    return {
+        "job_id": job.id,
+        "document_id": job.document_id,
+        "title": job.title,
+        "status": job.status,
+        "stage": job.stage,
+        "pages_total": job.pages_total,
+        "pages_parsed": job.pages_parsed,
+        "chunks_total": job.chunks_total,
+        "chunks_embedded": job.chunks_embedded,
+        "committed": job.committed,
+        "cancel_requested": job.cancel_requested,
+        "error": job.error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at
+    }
+
+class JobProgress:
+    """Writes a job's progress to its row as the document processor reports it"""
+
+    def __init__(self, queue: "IngestionQueue", job_id: str):
+        self.queue = queue
+        self.job_id = job_id
+
+    async def update(self, **fields):
+        await self.queue._update_job(self.job_id, **fields)
+
+    async def check_cancelled(self):
+        # Read the flag from the row so a cancel sent to any worker process is seen
+        if await self.queue._cancel_requested(self.job_id):
+            raise IngestionCancelled()
+
+class IngestionQueue:
+    """Bounded queue of document ingestion jobs drained by a fixed pool of worker tasks.
+
+    Job rows are written through new_session() and the db helpers, like the
+    documents themselves: with DB_ASYNC they don't block the event loop, and on
+    SQLite they queue for the single writer with the other async sessions.
+    """
+
+    def __init__(self, chroma_db: ChromaDatabase, parse_pool: Executor, workers: int = Config.INGEST_WORKERS,
+                 max_pending: int = Config.INGEST_QUEUE_SIZE):
+        self.chroma_db = chroma_db
+        self.parse_pool = parse_pool
+        self.worker_count = workers
+        self._queue = asyncio.Queue(maxsize=max_pending)
+        self._workers = []
+
+    async def _cancel_requested(self, job_id: str) -> bool:
+        db = new_session()
+        try:
+            job = await get(db, IngestionJob, job_id)
+            return bool(job and job.cancel_requested)
+        finally:
+            await close(db)
+
+    async def _update_job(self, job_id: str, **fields):
+        db = new_session()
+        try:
+            job = await get(db, IngestionJob, job_id)
+            for name, value in fields.items():
+                setattr(job, name, value)
+            await commit(db)
+        finally:
+            await close(db)
+
+    def start(self, recover: bool = Config.INGEST_RECOVER_JOBS):
+        """Fail jobs interrupted by a restart (all of them, or only ones whose worker process is gone), then start the workers"""
+        fail_interrupted_jobs(orphaned_only=not recover)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, file_path: str, title: str) -> dict:
+        """Record a queued job and hand it to the workers"""
+        if self._queue.full():
+            raise QueueFull("Ingestion queue is full, try again later")
+        db = new_session()
+        try:
+            job = IngestionJob(id=uuid.uuid4().hex, title=title, file_path=file_path, status="queued",
+                               worker_pid=os.getpid())
+            db.add(job)
+            await commit(db)
+            try:
+                self._queue.put_nowait(job.id)
+            except asyncio.QueueFull:
+                # Other submissions filled the queue while the row was being written
+                job.status = "failed"
+                job.error = "Ingestion queue is full"
+                await commit(db)
+                raise QueueFull("Ingestion queue is full, try again later")
+            return job_to_dict(job)
+        finally:
+            await close(db)
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        db = new_session()
+        try:
+            job = await get(db, IngestionJob, job_id)
+            return job_to_dict(job) if job else None
+        finally:
+            await close(db)
+
+    async def cancel(self, job_id: str) -> Optional[dict]:
+        """Request cancellation; queued jobs are skipped, running jobs stop at the next checkpoint"""
+        db = new_session()
+        try:
+            job = await get(db, IngestionJob, job_id)
+            if job is None:
+                return None
+            if job.status in ("queued", "running"):
+                job.cancel_requested = True
+                if job.status == "queued":
+                    job.status = "cancelled"
+                await commit(db)
+            return job_to_dict(job)
+        finally:
+            await close(db)
+
+    async def _worker(self):
+        request_priority.set(INGEST)  # this task's upstream calls queue behind chats and batches
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.exception("Ingestion worker error for job %s: %s", job_id, e)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        db = new_session()
+        try:
+            job = await get(db, IngestionJob, job_id)
+            if job is None or job.status != "queued":  # cancelled while waiting
+                return
+            file_path, title = job.file_path, job.title
+            job.status = "running"
+            await commit(db)
+        finally:
+            await close(db)
+
+        session = new_session()
+        processor = DocumentProcessor(session, self.chroma_db, self.parse_pool)
+        try:
+            with span("ingest.job"):
+                await processor.process_document(file_path, title, progress=JobProgress(self, job_id))
+            await self._update_job(job_id, status="succeeded", stage=None)
+            logger.info("Document %s has been processed (job %s)", title, job_id)
+        except IngestionCancelled:
+            await self._update_job(job_id, status="cancelled")
+            logger.info("Ingestion job %s cancelled", job_id)
+        except asyncio.CancelledError:
+            # Server shutdown; the processor has removed what the job stored. Record it even though
+            # this task is being cancelled
+            update = asyncio.ensure_future(
+                self._update_job(job_id, status="failed", error="Interrupted by server shutdown")
+            )
+            try:
+                await asyncio.shield(update)
+            except asyncio.CancelledError:
+                await update
+            raise
+        except Exception as e:
+            await self._update_job(job_id, status="failed", error=str(e))
+            logger.exception("Error processing document: %s", e)
+        finally:
+            await close(session)
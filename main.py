@@ -1,18 +1,81 @@
-from fastapi import FastAPI, HTTPException, Depends
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Request, Query
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from document_processor import DocumentProcessor
 from message_processor import MessageProcessor
-from db import get_db, engine
-from models import Base
+from clients import ClientRegistry, get_clients
+from ingestion_jobs import IngestionQueue, QueueFull
+from message_writer import MessageWriter
+from scheduler import ProviderUnavailable
+from db import get_db, get_session, new_session, close, get, init_db, dispose_engines, SessionLocal
+from models import Conversation
+from conversations import create_conversation, conversation_to_dict, get_history, InvalidCursor
 from pydantic import BaseModel
+from typing import List, Optional
+from telemetry import configure_logging, register_collector, unregister_collector, stats_gauges, render_metrics, \
+    start_trace, end_trace, span, REQUEST_SECONDS
+from warmup import WarmUp
 from config import Config
+import anyio
+import json
+import logging
+import math
 import os
+import time
 
-# Initialize database tables
-Base.metadata.create_all(bind=engine)
+configure_logging()
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared provider clients once and close them on shutdown"""
+    # Tables are created here rather than at import, so importing the app stays cheap
+    with span("startup.create_schema"):
+        await init_db()
+    app.state.clients = ClientRegistry()
+    # Train the local classifier from logged, already-classified messages
+    db = SessionLocal()
+    try:
+        trained = app.state.clients.classifier.train_from_db(db)
+        logger.info("Local classifier trained on %d messages", trained)
+    finally:
+        db.close()
+    if Config.WEATHER_WARM_UP:
+        app.state.clients.weather.warm_up()
+    app.state.warm_up = WarmUp(app.state.clients) if Config.WARM_UP else None
+    if app.state.warm_up is not None:
+        task = app.state.warm_up.start()
+        if Config.WARM_UP_BLOCKING:
+            await task
+    app.state.ingestion = IngestionQueue(app.state.clients.chroma_db, app.state.clients.parse_pool)
+    app.state.ingestion.start()
+    app.state.message_writer = MessageWriter() if Config.MESSAGE_WRITE_BEHIND else None
+    if app.state.message_writer is not None:
+        app.state.message_writer.start()
+
+    def collect_metrics():
+        samples = app.state.clients.metric_samples()
+        if app.state.message_writer is not None:
+            samples.update(stats_gauges("message_writer", app.state.message_writer.stats))
+        return samples
+
+    register_collector(collect_metrics)
+    try:
+        yield
+    finally:
+        unregister_collector(collect_metrics)
+        if app.state.warm_up is not None:
+            await app.state.warm_up.stop()
+        await app.state.ingestion.stop()
+        if app.state.message_writer is not None:
+            # Durable flush: every queued message is committed before the process exits
+            await app.state.message_writer.stop()
+        await app.state.clients.aclose()
+        await dispose_engines()
 
 # Create FastAPI app with metadata for documentation
 app = FastAPI(
+    lifespan=lifespan,
     title="AI Chat Platform",
     description="""
     A conversational AI platform that processes messages and documents using various AI models.
@@ -30,24 +93,95 @@ app = FastAPI(
     }
 )
 
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    """Time every request by route template and, with TRACE_CONTEXT, continue or start its trace"""
+    token = None
+    if Config.TRACE_CONTEXT:
+        token, traceparent = start_trace(request.headers.get("traceparent"))
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if token is not None:
+            response.headers["traceparent"] = traceparent
+        return response
+    finally:
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method, route=route.path if route else "unmatched", status=status
+        )
+        if token is not None:
+            end_trace(token)
+
+@app.exception_handler(ProviderUnavailable)
+async def provider_unavailable(request: Request, exc: ProviderUnavailable):
+    """Push back on clients (503 when a provider's queue is full, 429 when it keeps rate limiting us)"""
+    return JSONResponse(
+        {"detail": str(exc), "provider": exc.provider},
+        status_code=exc.status_code,
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
+    )
+
 # Pydantic models for request/response
 class MessageRequest(BaseModel):
     content: str
+    conversation_id: Optional[int] = None
+
+class BatchMessageRequest(BaseModel):
+    messages: List[str]
+    conversation_id: Optional[int] = None
+
+class ConversationRequest(BaseModel):
+    title: Optional[str] = None
+
+async def _require_conversation(db, conversation_id: Optional[int]):
+    if conversation_id is not None and await get(db, Conversation, conversation_id) is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+# Processor dependencies. Plain functions, so FastAPI runs them in its threadpool: the first
+# MessageProcessor creates the provider clients, importing their SDKs, which mustn't block the event loop
+def get_message_writer(request: Request):
+    return request.app.state.message_writer
+
+def get_message_processor(
+    db=Depends(get_session),
+    clients: ClientRegistry = Depends(get_clients),
+    message_writer: MessageWriter = Depends(get_message_writer)
+) -> MessageProcessor:
+    return MessageProcessor(db, clients, message_writer)
+
+def get_stream_processor(
+    clients: ClientRegistry = Depends(get_clients),
+    message_writer: MessageWriter = Depends(get_message_writer)
+) -> MessageProcessor:
+    # The stream outlives the request's dependencies, so it owns its session (closed by _sse_events)
+    return MessageProcessor(new_session(), clients, message_writer)
+
+# Ingestion queue dependency
+def get_ingestion_queue(request: Request) -> IngestionQueue:
+    return request.app.state.ingestion
 
 @app.post("/documents/", 
     tags=["Documents"],
     summary="Process a PDF document",
+    status_code=202,
     description="""
-    Processes a PDF document by:
+    Queues a background job that processes a PDF document by:
     1. Splitting it into pages
     2. Chunking the content
     3. Embedding chunks using OpenAI's text-embedding-3-small
     4. Storing in ChromaDB for vector search
     5. Storing metadata in SQL database
+
+    Returns the job immediately; poll `/documents/jobs/{job_id}` for progress.
+    Responds with 503 when the ingestion queue is full.
     """)
 
-async def process_document(db: Session = Depends(get_db)):
-    """Process the configured PDF document"""
+async def process_document(ingestion: IngestionQueue = Depends(get_ingestion_queue)):
+    """Queue processing of the configured PDF document"""
     try:
         # Get file path from config
         file_path = Config.PDF_STORAGE_PATH
@@ -63,18 +197,39 @@ async def process_document(db: Session = Depends(get_db)):
         # Remove extension for title
         title = os.path.splitext(file_name)[0]
         
-        # Add debug logging
-        print(f"Processing document: {file_path}")
-        print(f"Title: {title}")
-
-        processor = DocumentProcessor(db)
-        result = await processor.process_document(file_path, title)
-        print("Document has been processed") #TODO: Remove this
-        return result
+        logger.info("Queueing document %s (title %s)", file_path, title)
+
+        return await ingestion.submit(file_path, title)
+    except HTTPException:
+        raise
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
-        print(f"Error processing document: {str(e)}")  # Add debug logging
+        logger.exception("Error processing document: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/documents/jobs/{job_id}",
+    tags=["Documents"],
+    summary="Document ingestion job status",
+    description="Returns the job's status and per-stage progress (pages parsed, chunks embedded, committed)")
+async def get_document_job(job_id: str, ingestion: IngestionQueue = Depends(get_ingestion_queue)):
+    """Ingestion job status"""
+    job = await ingestion.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/documents/jobs/{job_id}/cancel",
+    tags=["Documents"],
+    summary="Cancel a document ingestion job",
+    description="Queued jobs are dropped; running jobs stop at their next checkpoint and roll back their SQL writes")
+async def cancel_document_job(job_id: str, ingestion: IngestionQueue = Depends(get_ingestion_queue)):
+    """Cancel an ingestion job"""
+    job = await ingestion.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @app.post("/messages/",
     tags=["Messages"],
     summary="Process a user message",
@@ -88,17 +243,196 @@ async def process_document(db: Session = Depends(get_db)):
 
 async def create_message(
     message: MessageRequest,
-    db: Session = Depends(get_db)
+    processor: MessageProcessor = Depends(get_message_processor)
 ):
     """Process a user message and generate response"""
+    await _require_conversation(processor.db_session, message.conversation_id)
     try:
-        processor = MessageProcessor(db)
-        result = await processor.process_message(message.content)
-        print("Your message has been processed") #TODO: Remove this
-        return result
+        return await processor.process_message(message.content, message.conversation_id)
+    except ProviderUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     
+@app.post("/messages/batch",
+    tags=["Messages"],
+    summary="Process many user messages at once",
+    description="""
+    Same pipeline as `/messages/` for up to `BATCH_MAX_MESSAGES` messages, with shared upstream calls:
+    1. Messages the local classifier can't label are classified together in packed LLM calls
+    2. All food queries are embedded in one request and searched with one multi-query vector lookup
+    3. Answers are generated with bounded concurrency (`BATCH_CONCURRENCY`)
+
+    Results come back in input order; an item that fails has `error` set and is not stored.
+    """)
+async def create_message_batch(
+    batch: BatchMessageRequest,
+    processor: MessageProcessor = Depends(get_message_processor)
+):
+    """Process a batch of user messages"""
+    if not batch.messages:
+        raise HTTPException(status_code=400, detail="No messages given")
+    if len(batch.messages) > Config.BATCH_MAX_MESSAGES:
+        raise HTTPException(status_code=400, detail=f"At most {Config.BATCH_MAX_MESSAGES} messages per batch")
+    await _require_conversation(processor.db_session, batch.conversation_id)
+    try:
+        return await processor.process_batch(batch.messages, batch.conversation_id)
+    except ProviderUnavailable:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _sse_events(processor: MessageProcessor, content: str, conversation_id: Optional[int], classified: tuple):
+    """Format processor stream events as Server-Sent Events"""
+    try:
+        async for event, data in processor.stream_message(content, conversation_id, classified):
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    finally:
+        # Shielded like the save at the end of the stream, which it must not overtake
+        with anyio.CancelScope(shield=True):
+            await close(processor.db_session)
+
+@app.post("/messages/stream",
+    tags=["Messages"],
+    summary="Process a user message and stream the response",
+    description="""
+    Same pipeline as `/messages/`, streamed as Server-Sent Events:
+    1. `category` event as soon as the message is classified
+    2. `token` events forwarding the response as the model produces it
+    3. `done` event (or `error`) when the response is complete
+
+    Both messages are stored once the stream ends, including when the client disconnects early.
+    """)
+async def stream_message(
+    message: MessageRequest,
+    processor: MessageProcessor = Depends(get_stream_processor)
+):
+    """Stream the response to a user message"""
+    try:
+        await _require_conversation(processor.db_session, message.conversation_id)
+        # Classify and refuse up front: once the stream has started its status can no longer change.
+        # Only the providers this category needs are checked (a full Groq queue doesn't stop weather)
+        classified = await processor.classify_with_source(message.content)
+        processor.check_capacity([classified[0]])
+    except (HTTPException, ProviderUnavailable):
+        await close(processor.db_session)
+        raise
+    except Exception as e:
+        await close(processor.db_session)
+        raise HTTPException(status_code=400, detail=f"Error processing message: {str(e)}")
+    return StreamingResponse(
+        _sse_events(processor, message.content, message.conversation_id, classified),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/conversations/",
+    tags=["Conversations"],
+    summary="Start a conversation",
+    description="Creates a conversation; pass its id as `conversation_id` when sending messages")
+async def start_conversation(request: Optional[ConversationRequest] = None, db=Depends(get_session)):
+    """Create a conversation"""
+    conversation = await create_conversation(db, request.title if request else None)
+    return conversation_to_dict(conversation)
+
+@app.get("/conversations/{conversation_id}/messages",
+    tags=["Conversations"],
+    summary="Conversation history",
+    description="""
+    Returns a conversation's messages newest first. Pass the returned `next_cursor`
+    as `cursor` to fetch the next (older) page; it is null on the last page.
+    Pagination is keyset-based, so deep pages cost the same as the first one.
+    """)
+async def conversation_history(
+    conversation_id: int,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Page through a conversation's messages"""
+    await _require_conversation(db, conversation_id)
+    try:
+        return get_history(db, conversation_id, limit, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/classifier/stats",
+    tags=["Messages"],
+    summary="Local classifier counters",
+    description="Returns how many messages were classified locally versus sent to the LLM")
+async def classifier_stats(clients: ClientRegistry = Depends(get_clients)):
+    """Local classifier hit/fallback counters"""
+    return clients.classifier.get_stats()
+
+@app.get("/cache/stats",
+    tags=["Messages"],
+    summary="Semantic answer cache counters",
+    description="Returns hit/miss/eviction counters and the current size of the food query answer cache")
+async def cache_stats(clients: ClientRegistry = Depends(get_clients)):
+    """Semantic cache counters"""
+    if clients.semantic_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **clients.semantic_cache.get_stats()}
+
+@app.get("/retrieval/stats",
+    tags=["Messages"],
+    summary="Retrieval path counters",
+    description="Returns how many food queries were answered from BM25 alone (no embedding call), hybrid fusion, vector search alone, or BM25 after the embedding call failed, plus estimated prompt context tokens sent and saved by chunk merging and deduplication")
+async def retrieval_stats(clients: ClientRegistry = Depends(get_clients)):
+    """Retrieval path counters"""
+    return clients.retrieval_stats
+
+@app.get("/coalescing/stats",
+    tags=["Messages"],
+    summary="Upstream call coalescing counters",
+    description="Returns, per provider operation, how many upstream calls were made and how many identical concurrent calls shared an in-flight one")
+async def coalescing_stats(clients: ClientRegistry = Depends(get_clients)):
+    """Singleflight counters"""
+    return clients.flight.get_stats()
+
+@app.get("/providers/stats",
+    tags=["Messages"],
+    summary="Provider scheduler state",
+    description="Returns, per provider, calls in flight, queue depth by priority (interactive, batch, ingest), retries, upstream rate limiting and rejected calls")
+async def provider_stats(clients: ClientRegistry = Depends(get_clients)):
+    """Provider scheduler counters"""
+    return {provider: scheduler.get_stats() for provider, scheduler in clients.schedulers.items()}
+
+@app.get("/weather/stats",
+    tags=["Messages"],
+    summary="Weather cache counters",
+    description="Returns fresh/stale hit and refresh counters for the weather cache")
+async def weather_stats(clients: ClientRegistry = Depends(get_clients)):
+    """Weather cache counters"""
+    return clients.weather.get_stats()
+
+@app.get("/metrics",
+    tags=["Root"],
+    summary="Prometheus metrics",
+    description="""
+    Prometheus text exposition of per-stage and per-route latency histograms, time to first
+    streamed token, and the counters behind the `/…/stats` endpoints as `chat_component_stat` gauges.
+    """,
+    response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready",
+    tags=["Root"],
+    summary="Readiness",
+    description="""
+    200 once the startup warm-up has opened Chroma and loaded the search indexes, 503 until then
+    (always 200 with `WARM_UP=false`). Lists each warm-up step's status, duration and error.
+    """)
+async def ready(request: Request):
+    """Readiness probe"""
+    warm_up = request.app.state.warm_up
+    if warm_up is None:
+        return {"ready": True, "steps": {}}
+    status = warm_up.get_status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
 @app.get("/", 
     tags=["Root"],
     summary="Root endpoint",
@@ -111,7 +445,20 @@ async def root():
         "status": "active",
         "endpoints": [
             "/documents/",
-            "/messages/"
+            "/documents/jobs/{job_id}",
+            "/messages/",
+            "/messages/stream",
+            "/messages/batch",
+            "/conversations/",
+            "/conversations/{conversation_id}/messages",
+            "/classifier/stats",
+            "/cache/stats",
+            "/retrieval/stats",
+            "/coalescing/stats",
+            "/providers/stats",
+            "/weather/stats",
+            "/metrics",
+            "/ready"
         ]
     }
 
@@ -1,55 +1,347 @@
-from openai import OpenAI
-from groq import Groq
-from database.chroma_client import ChromaDatabase
+import asyncio
+import anyio
+import json
+import logging
+import time
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple, Union
+from context_builder import build_context
+from conversations import message_to_dict
+from message_writer import MessageWriter
 from models import Message
+from retrieval import reciprocal_rank_fusion, result_row, top_results
+from scheduler import BATCH, ProviderUnavailable, request_priority
 from sqlalchemy.orm import Session
 from datetime import datetime
+from db import commit, rollback
+from telemetry import CONTEXT_TOKENS, FIRST_TOKEN_SECONDS, sample_payload, span
 from config import Config
-from weatherapi import get_current_weather
+
+if TYPE_CHECKING:
+    from clients import ClientRegistry  # imports every provider SDK
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+OTHER_REPLY = "I can only help with food and weather related queries."
+FOOD_ERROR_REPLY = "I encountered an error while processing your food-related query. Please try again."
+CATEGORIES = ("food", "weather", "other")
+# Providers answering a category needs: food embeds the query and asks Groq, weather asks OpenAI
+CATEGORY_PROVIDERS = {"food": ("openai", "groq"), "weather": ("openai",)}
+MAX_EMBEDDING_INPUTS = 2048  # per embedding request (API limit)
+
+class Generation:
+    """A prepared chat completion: either a ready answer or the request that produces one"""
+
+    def __init__(self, answer: Optional[str] = None, client=None, params: Optional[dict] = None,
+                 on_complete: Optional[Callable[[str], None]] = None, provider: str = ""):
+        self.answer = answer
+        self.client = client
+        self.params = params
+        self.on_complete = on_complete
+        self.provider = provider
+
+    async def complete(self) -> str:
+        if self.answer is not None:
+            return self.answer
+        with span(f"generate.{self.provider}"):
+            completion = await self.client.chat.completions.create(**self.params)
+        response = completion.choices[0].message.content
+        if self.on_complete is not None:
+            self.on_complete(response)
+        return response
+
+    async def stream(self):
+        """Yield the response as the provider produces it"""
+        if self.answer is not None:
+            yield self.answer
+            return
+        with span(f"generate.{self.provider}"):
+            started = time.perf_counter()
+            stream = await self.client.chat.completions.create(**self.params, stream=True)
+            parts = []
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not parts:
+                        FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started, provider=self.provider)
+                    parts.append(delta)
+                    yield delta
+        if self.on_complete is not None:
+            self.on_complete("".join(parts))
 
 class MessageProcessor:
-    def __init__(self, db_session: Session):
+    def __init__(self, db_session: Union[Session, "AsyncSession"], clients: "ClientRegistry", message_writer: Optional[MessageWriter] = None):
         self.db_session = db_session
-        self.chroma_db = ChromaDatabase()
-        self.openai_client = OpenAI(api_key=Config.OPENAI_API_KEY)
-        self.groq_client = Groq(api_key=Config.GROQ_API_KEY)
+        self.message_writer = message_writer
+        self.chroma_db = clients.chroma_db
+        self.openai_client = clients.openai_client
+        self.groq_client = clients.groq_client
+        self.weather = clients.weather
+        self.classifier = clients.classifier
+        self.semantic_cache = clients.semantic_cache
+        self.retrieval_stats = clients.retrieval_stats
+        self._check_capacity = clients.check_capacity
+
+    def check_capacity(self, categories):
+        """Raise ProviderUnavailable (503) when a provider needed to answer these categories has a full queue"""
+        providers = {provider for category in categories for provider in CATEGORY_PROVIDERS.get(category, ())}
+        if providers:
+            self._check_capacity(providers)
 
     async def classify_message(self, content: str) -> str:
         """Classify message as food or weather related"""
-        completion = self.openai_client.chat.completions.create(
-            model=Config.OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": "Classify if this message is about food or weather. Reply with only 'food' or 'weather' or 'other'."},
-                {"role": "user", "content": content}
-            ],
-            temperature=0.0
-        )
-        print(f"MSG classification completed: {completion.choices[0].message.content.strip().lower()}")
-        return completion.choices[0].message.content.strip().lower()
+        return (await self.classify_with_source(content))[0]
 
-    async def process_food_query(self, query: str) -> str:
-        """Process food-related query using RAG with Llama"""
+    async def classify_with_source(self, content: str) -> Tuple[str, str]:
+        """Classify a message; returns (category, source) where source is 'local' or 'llm'"""
+        # Local fast path; only ask the LLM when the local classifier isn't confident
+        category = self.classifier.classify(content)
+        if category is not None:
+            logger.debug("Message classified locally: %s", category)
+            return category, "local"
+        return await self._classify_llm(content), "llm"
+
+    async def _classify_llm(self, content: str) -> str:
+        with span("classify.llm"):
+            completion = await self.openai_client.chat.completions.create(
+                model=Config.OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": "Classify if this message is about food or weather. Reply with only 'food' or 'weather' or 'other'."},
+                    {"role": "user", "content": content}
+                ],
+                temperature=0.0
+            )
+        category = completion.choices[0].message.content.strip().lower()
+        logger.debug("Message classified by the LLM: %s", category)
+        # Feed the LLM's label back into the local model
+        self.classifier.learn(content, category)
+        return category
+
+    async def classify_messages(self, contents: List[str]) -> List[Tuple[Optional[str], Optional[str]]]:
+        """classify_with_source for many messages: local first, the rest packed into one LLM call per group"""
+        results = []
+        for content in contents:
+            category = self.classifier.classify(content)
+            results.append((category, "local" if category is not None else None))
+        pending = [i for i, (category, _) in enumerate(results) if category is None]
+        if pending:
+            self._check_capacity(["openai"])
+        size = Config.BATCH_CLASSIFY_SIZE
+        for group in (pending[i:i + size] for i in range(0, len(pending), size)):
+            try:
+                labels = await self._classify_packed([contents[i] for i in group])
+            except ProviderUnavailable:
+                # Overloaded or rate limited: a call per message would make it worse, so the batch gets the 503/429.
+                # Only malformed or partial replies fall back to one call per message
+                raise
+            except Exception as e:
+                logger.warning("Packed classification of %d messages failed (%s), classifying one by one", len(group), e)
+                labels = {}
+            for number, i in enumerate(group, 1):
+                category = labels.get(str(number))
+                if category in CATEGORIES:
+                    self.classifier.learn(contents[i], category)
+                    results[i] = (category, "llm")
+        # Whatever the packed reply left out goes to the LLM on its own (the local classifier already
+        # declined it, and asking again would count it twice); failures stay (None, None)
+        semaphore = asyncio.Semaphore(Config.BATCH_CONCURRENCY)
+
+        async def classify_one(i: int):
+            async with semaphore:
+                results[i] = (await self._classify_llm(contents[i]), "llm")
+
+        missing = [i for i, (category, _) in enumerate(results) if category is None]
+        for i, outcome in zip(missing, await asyncio.gather(*map(classify_one, missing), return_exceptions=True)):
+            if isinstance(outcome, Exception):
+                logger.warning("Classifying batch item %d failed: %s", i, outcome)
+        return results
+
+    async def _classify_packed(self, contents: List[str]) -> dict:
+        """One LLM call labelling numbered messages; returns {"1": "food", ...}"""
+        # One line per message, so a message's own line breaks can't shift the numbering
+        numbered = "\n".join(f"{number}. {' '.join(content.split())}" for number, content in enumerate(contents, 1))
+        with span("classify.llm_batch"):
+            completion = await self.openai_client.chat.completions.create(
+                model=Config.OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": "Classify each numbered message as being about food or weather. Reply with only a JSON object mapping every message number to 'food' or 'weather' or 'other', for example {\"1\": \"food\", \"2\": \"other\"}."},
+                    {"role": "user", "content": numbered}
+                ],
+                temperature=0.0,
+                response_format={"type": "json_object"}
+            )
+        labels = json.loads(completion.choices[0].message.content)
+        return {str(number): str(label).strip().lower() for number, label in labels.items()}
+
+    async def embed_queries(self, queries: List[str]) -> list:
+        """embed_query for many queries; identical queries are embedded once"""
+        unique = list(dict.fromkeys(queries))
+        vectors = {}
+        with span("embed_query"):
+            for start in range(0, len(unique), MAX_EMBEDDING_INPUTS):
+                batch = unique[start:start + MAX_EMBEDDING_INPUTS]
+                response = await self.openai_client.embeddings.create(
+                    model=Config.OPENAI_EMBEDDING_MODEL,
+                    input=batch,
+                    dimensions=Config.EMBEDDING_DIMENSIONS
+                )
+                for item in response.data:
+                    vectors[batch[item.index]] = item.embedding
+        return [vectors[query] for query in queries]
+
+    async def embed_query(self, query: str):
+        """Embed a query with the same model and dimensions as the stored chunks"""
+        with span("embed_query"):
+            response = await self.openai_client.embeddings.create(
+                model=Config.OPENAI_EMBEDDING_MODEL,
+                input=[query],
+                dimensions=Config.EMBEDDING_DIMENSIONS
+            )
+        return response.data[0].embedding
+
+    async def lexical_search(self, query: str) -> Optional[dict]:
+        """BM25 candidates for a food query, or None when hybrid search is disabled"""
+        if not Config.HYBRID_SEARCH:
+            return None
+        with span("retrieve.lexical"):
+            return await asyncio.to_thread(
+                self.chroma_db.lexical_search, "document_chunks", query, Config.RETRIEVAL_CANDIDATES
+            )
+
+    async def vector_search(self, query_embedding, lexical: Optional[dict], n_results: int) -> dict:
+        """Nearest chunks by embedding, fused with the lexical ranking when there is one"""
+        return (await self.vector_search_many([query_embedding], [lexical], n_results))[0]
+
+    async def vector_search_many(self, query_embeddings: list, lexicals: List[Optional[dict]], n_results: int) -> List[dict]:
+        """vector_search for several queries with one multi-query index call"""
+        # Vector search is blocking, so run it in a worker thread
+        with span("retrieve.vector"):
+            results = await asyncio.to_thread(
+                self.chroma_db.query,
+                "document_chunks",
+                query_embeddings,
+                Config.RETRIEVAL_CANDIDATES if any(lexicals) else n_results
+            )
+        fused = []
+        for row, lexical in enumerate(lexicals):
+            row_results = result_row(results, row)
+            if not lexical:
+                self.retrieval_stats["vector_only"] += 1
+                fused.append(top_results(row_results, n_results))
+            else:
+                self.retrieval_stats["hybrid"] += 1
+                fused.append(reciprocal_rank_fusion([row_results, lexical], n_results))
+        return fused
+
+    async def _cached_answer(self, query_embedding) -> Optional[Generation]:
+        if self.semantic_cache is None:
+            return None
+        # A scan over every cached vector: a few ms on a full cache, so not on the event loop
+        cached = await asyncio.to_thread(self.semantic_cache.lookup, query_embedding)
+        if cached is None:
+            return None
+        logger.debug("Semantic cache hit for food query")
+        return Generation(answer=cached)
+
+    async def prepare_food_query(self, query: str) -> Generation:
+        """Retrieve context for a food query and build the Groq request (or return a cached answer)"""
+        n_results = Config.CONTEXT_MAX_CHUNKS
+        lexical = await self.lexical_search(query)
+        query_embedding = None
+        cache_generation = None
+        if lexical and lexical["confidence"] >= Config.LEXICAL_CONFIDENCE:
+            # Every distinctive query term is in the top chunk: answer without an embedding round trip
+            self.retrieval_stats["lexical_only"] += 1
+            results = top_results(lexical, n_results)
+        else:
+            try:
+                # Embed once: the vector is both the cache key and the vector search query
+                query_embedding = await self.embed_query(query)
+            except Exception as e:
+                if not lexical or not lexical["ids"][0]:
+                    raise
+                logger.warning("Query embedding failed (%s), answering from lexical results", e)
+                self.retrieval_stats["embedding_fallbacks"] += 1
+                results = top_results(lexical, n_results)
+
+        if query_embedding is not None:
+            if self.semantic_cache is not None:
+                cache_generation = self.semantic_cache.generation
+            cached = await self._cached_answer(query_embedding)
+            if cached is not None:
+                return cached
+            results = await self.vector_search(query_embedding, lexical, n_results)
+        return self.food_generation(query, results, query_embedding, cache_generation)
+
+    async def prepare_food_queries(self, queries: List[str]) -> list:
+        """prepare_food_query for many queries, with one embedding request and one multi-query vector search.
+
+        Returns, per query, its Generation or the exception that prevented it.
+        """
+        n_results = Config.CONTEXT_MAX_CHUNKS
+        lexicals = [None] * len(queries)
+        if Config.HYBRID_SEARCH:
+            with span("retrieve.lexical"):
+                lexicals = await asyncio.to_thread(lambda: [
+                    self.chroma_db.lexical_search("document_chunks", query, Config.RETRIEVAL_CANDIDATES)
+                    for query in queries
+                ])
+        prepared, to_embed = [None] * len(queries), []
+        for i, lexical in enumerate(lexicals):
+            if lexical and lexical["confidence"] >= Config.LEXICAL_CONFIDENCE:
+                self.retrieval_stats["lexical_only"] += 1
+                prepared[i] = self.food_generation(queries[i], top_results(lexical, n_results))
+            else:
+                to_embed.append(i)
+        if not to_embed:
+            return prepared
+
+        cache_generation = self.semantic_cache.generation if self.semantic_cache is not None else None
         try:
-            # Get relevant chunks from ChromaDB
-            collection = self.chroma_db.get_collection("document_chunks")
-            results = collection.query(
-                query_texts=[query],
-                n_results=3  # Get top 3 most relevant chunks
-        )
-        
-            # Detailed logging of retrieved chunks
-            print("\n=== Retrieved Chunks from PDF ===")
+            embeddings = await self.embed_queries([queries[i] for i in to_embed])
+        except Exception as e:
+            logger.warning("Batch query embedding failed (%s), answering from lexical results", e)
+            for i in to_embed:
+                if lexicals[i] and lexicals[i]["ids"][0]:
+                    self.retrieval_stats["embedding_fallbacks"] += 1
+                    prepared[i] = self.food_generation(queries[i], top_results(lexicals[i], n_results))
+                else:
+                    prepared[i] = e
+            return prepared
+
+        searches = []
+        for i, embedding in zip(to_embed, embeddings):
+            prepared[i] = await self._cached_answer(embedding)
+            if prepared[i] is None:
+                searches.append((i, embedding))
+        if searches:
+            try:
+                results = await self.vector_search_many(
+                    [embedding for _, embedding in searches], [lexicals[i] for i, _ in searches], n_results
+                )
+            except Exception as e:
+                logger.exception("Batch vector search failed: %s", e)
+                results = [e] * len(searches)
+            for (i, embedding), row in zip(searches, results):
+                if isinstance(row, Exception):
+                    prepared[i] = row
+                else:
+                    prepared[i] = self.food_generation(queries[i], row, embedding, cache_generation)
+        return prepared
+
+    def food_generation(self, query: str, results: dict, query_embedding=None, cache_generation=None) -> Generation:
+        """Build the Groq request answering a food query from retrieved chunks"""
+        # Full chunks and prompts are only logged for a sample of requests (DEBUG_PAYLOAD_SAMPLE_RATE)
+        log_payload = sample_payload()
+        if log_payload:
             for i, chunk in enumerate(results['documents'][0]):
-                print(f"\nChunk {i + 1}:")
-                print(f"Content: {chunk[:200]}...")  # Print first 200 chars of each chunk
-                print(f"Metadata: {results['metadatas'][0][i]}")  # Print metadata (page numbers etc.)
-                print("-" * 50)
-            
-            # Construct context from relevant chunks
-            context = "\n".join(results['documents'][0])
-            
-            # Log the complete prompt being sent to Groq
-            print("\n=== Prompt to Groq ===")
+                logger.info("Retrieved chunk %d %s: %s", i + 1, results['metadatas'][0][i], chunk[:200])
+
+        with span("prompt_build"):
+            # Construct context from relevant chunks, merged and deduplicated within the token budget
+            context, context_stats = build_context(results)
             prompt = f"""Based on the following excerpts from the document:
 
     Context: {context}
@@ -59,91 +351,203 @@ class MessageProcessor:
     Please answer the question using ONLY the information from the provided context. 
     If the context doesn't contain relevant information, please say "I don't find relevant information about this in the document."
     """
-            print(prompt)
-            print("=" * 50)
-            
-            # Generate response using Groq
-            messages = [
-                {
-                    "role": "system",
-                    "content": "You are a helpful assistant that answers questions STRICTLY based on the provided context. Do not make up information or use external knowledge."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
-            
-            completion = self.groq_client.chat.completions.create(
-                model=Config.GROQ_MODEL,
-                messages=messages,
-                temperature=0.3,  # Lower temperature for more focused responses
-                max_tokens=500
-            )
-            
-            response = completion.choices[0].message.content
-            print("\n=== Groq Response ===")
-            print(response)
-            
-            return response
-        
+        self.retrieval_stats["context_tokens"] += context_stats["context_tokens"]
+        self.retrieval_stats["context_tokens_saved"] += context_stats["tokens_saved"]
+        CONTEXT_TOKENS.observe(context_stats["context_tokens"], kind="sent")
+        CONTEXT_TOKENS.observe(context_stats["tokens_saved"], kind="saved")
+        logger.debug("Context: %s", context_stats)
+        if log_payload:
+            logger.info("Prompt to Groq: %s", prompt)
+
+        # Generate response using Groq
+        messages = [
+            {
+                "role": "system",
+                "content": "You are a helpful assistant that answers questions STRICTLY based on the provided context. Do not make up information or use external knowledge."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+
+        def on_complete(response: str):
+            if log_payload:
+                logger.info("Groq response: %s", response)
+            if self.semantic_cache is not None and query_embedding is not None:
+                self.semantic_cache.store(query_embedding, response, cache_generation)
+
+        return Generation(
+            client=self.groq_client,
+            params={
+                "model": Config.GROQ_MODEL,
+                "messages": messages,
+                "temperature": 0.3,  # Lower temperature for more focused responses
+                "max_tokens": 500
+            },
+            on_complete=on_complete,
+            provider="groq"
+        )
+
+    async def process_food_query(self, query: str) -> str:
+        """Process food-related query using RAG with Llama"""
+        try:
+            generation = await self.prepare_food_query(query)
+            return await generation.complete()
+        except ProviderUnavailable:
+            raise
         except Exception as e:
-            print(f"Error in process_food_query: {str(e)}")
-            return "I encountered an error while processing your food-related query. Please try again."
+            logger.exception("Error in process_food_query: %s", e)
+            return FOOD_ERROR_REPLY
+
+    async def prepare_weather_query(self, query: str) -> Generation:
+        """Fetch current weather and build the OpenAI request that phrases it"""
+        with span("weather"):
+            weather_data = await self.weather.get()
+
+        if not weather_data:
+            return Generation(answer="Sorry, I couldn't fetch the weather data at the moment.")
+
+        # Format weather data into a clear prompt
+        weather_info = {
+            'temperature': weather_data['current']['temp_c'],
+            'condition': weather_data['current']['condition']['text'],
+            'humidity': weather_data['current']['humidity'],
+            'wind_speed': weather_data['current']['wind_kph']
+        }
+
+        prompt = f"""Current weather in New York:
+        Temperature: {weather_info['temperature']}°C
+        Condition: {weather_info['condition']}
+        Humidity: {weather_info['humidity']}%
+        Wind Speed: {weather_info['wind_speed']} km/h"""
+
+        log_payload = sample_payload()
+        if log_payload:
+            logger.info("Weather prompt: %s", prompt)
+
+        return Generation(
+            client=self.openai_client,
+            params={
+                "model": Config.OPENAI_MODEL,  # Make sure this matches your .env
+                "messages": [
+                    {"role": "system", "content": "You are a helpful weather assistant. Convert the weather data into a natural, friendly response."},
+                    {"role": "user", "content": f"Based on this data: {prompt}, provide a natural language summary of the weather."}
+                ],
+                "temperature": 0.7
+            },
+            on_complete=lambda response: logger.info("Weather response: %s", response) if log_payload else None,
+            provider="openai"
+        )
 
     async def process_weather_query(self, query: str) -> str:
         """Process weather-related query"""
         try:
-            weather_data = get_current_weather()
-        
-            if weather_data:
-                # Format weather data into a clear prompt
-                weather_info = {
-                    'temperature': weather_data['current']['temp_c'],
-                    'condition': weather_data['current']['condition']['text'],
-                    'humidity': weather_data['current']['humidity'],
-                    'wind_speed': weather_data['current']['wind_kph']
-                }
-            
-                prompt = f"""Current weather in New York:
-                Temperature: {weather_info['temperature']}°C
-                Condition: {weather_info['condition']}
-                Humidity: {weather_info['humidity']}%
-                Wind Speed: {weather_info['wind_speed']} km/h"""
-                
-                print("Weather data formatted:", prompt)  # Debug print
-                
-                completion = self.openai_client.chat.completions.create(
-                    model=Config.OPENAI_MODEL,  # Make sure this matches your .env
-                    messages=[
-                        {"role": "system", "content": "You are a helpful weather assistant. Convert the weather data into a natural, friendly response."},
-                        {"role": "user", "content": f"Based on this data: {prompt}, provide a natural language summary of the weather."}
-                    ],
-                    temperature=0.7
-                )
-                
-                response = completion.choices[0].message.content
-                print("Generated response:", response)  # Debug print
-                return response
-        
-            return "Sorry, I couldn't fetch the weather data at the moment."
+            generation = await self.prepare_weather_query(query)
+            return await generation.complete()
+        except ProviderUnavailable:
+            raise
         except Exception as e:
-            print(f"Weather processing error: {str(e)}")
+            logger.exception("Weather processing error: %s", e)
             return f"I encountered an error while processing the weather data: {str(e)}"
 
-    async def process_message(self, content: str):
+    async def stream_response(self, category: str, content: str):
+        """Yield response tokens for an already classified message"""
+        try:
+            if category == "food":
+                generation = await self.prepare_food_query(content)
+            elif category == "weather":
+                generation = await self.prepare_weather_query(content)
+            else:
+                generation = Generation(answer=OTHER_REPLY)
+            async for token in generation.stream():
+                yield token
+        except ProviderUnavailable:
+            raise
+        except Exception as e:
+            logger.exception("Error streaming %s response: %s", category, e)
+            if category == "food":
+                yield FOOD_ERROR_REPLY
+            else:
+                yield f"I encountered an error while processing the weather data: {str(e)}"
+
+    async def _save_exchange(self, user_message: Message, response_content: str) -> Tuple[dict, dict]:
+        """Store the user message and the AI response in one commit (or hand them to the write-behind queue)"""
+        return (await self._save_exchanges([(user_message, response_content)]))[0]
+
+    async def _save_exchanges(self, exchanges: List[tuple]) -> List[Tuple[dict, dict]]:
+        """Store (user message, response) pairs in one commit; returns them as (user, AI) message dicts"""
+        messages = []
+        for user_message, response_content in exchanges:
+            ai_message = Message(
+                conversation_id=user_message.conversation_id,
+                reply_to=user_message,
+                is_ai=True,
+                content=response_content,
+                timestamp=datetime.utcnow()
+            )
+            messages.extend((user_message, ai_message))
+        if self.message_writer is not None:
+            # Snapshot first: once queued, the rows belong to the writer thread, which commits and expires them
+            saved = [(message_to_dict(user), message_to_dict(ai)) for user, ai in zip(messages[::2], messages[1::2])]
+            self.message_writer.enqueue(*messages)
+            return saved
+        with span("db_commit"):
+            self.db_session.add_all(messages)
+            await commit(self.db_session)
+        return [(message_to_dict(user), message_to_dict(ai)) for user, ai in zip(messages[::2], messages[1::2])]
+
+    async def stream_message(self, content: str, conversation_id: Optional[int] = None,
+                             classified: Optional[Tuple[str, str]] = None):
+        """Yield (event, data) pairs: the category first, then response tokens.
+
+        Both messages are saved when the stream ends, including when the client
+        disconnects partway through (the partial response is stored). Pass
+        classified, a (category, source) from classify_with_source, when the
+        message has already been classified.
+        """
+        user_message = Message(
+            conversation_id=conversation_id,
+            is_ai=False,
+            content=content,
+            timestamp=datetime.utcnow()
+        )
+        parts = []
+        try:
+            category, user_message.category_source = classified or await self.classify_with_source(content)
+            user_message.category = category
+            yield "category", {"category": category}
+
+            async for token in self.stream_response(category, content):
+                parts.append(token)
+                yield "token", {"content": token}
+            yield "done", {"category": category}
+        except Exception as e:
+            logger.exception("Error streaming message: %s", e)
+            yield "error", {"detail": f"Error processing message: {str(e)}"}
+        finally:
+            # Shielded: when the client disconnects the request is cancelled, but the exchange is still saved
+            with anyio.CancelScope(shield=True):
+                try:
+                    await self._save_exchange(user_message, "".join(parts))
+                except Exception as e:
+                    await rollback(self.db_session)
+                    logger.exception("Error saving streamed message: %s", e)
+
+    async def process_message(self, content: str, conversation_id: Optional[int] = None):
         """Process incoming message and generate response"""
         try:
             # Store user message
             user_message = Message(
+                conversation_id=conversation_id,
                 is_ai=False,
                 content=content,
                 timestamp=datetime.utcnow()
             )
-            self.db_session.add(user_message)
             
             # Classify message
-            category = await self.classify_message(content)
+            category, user_message.category_source = await self.classify_with_source(content)
+            user_message.category = category
             
             # Generate response based on classification
             if category == "food":
@@ -151,23 +555,83 @@ class MessageProcessor:
             elif category == "weather":
                 response_content = await self.process_weather_query(content)
             else:
-                response_content = "I can only help with food and weather related queries."
+                response_content = OTHER_REPLY
 
             # Store AI response
-            ai_message = Message(
-                is_ai=True,
-                content=response_content,
-                timestamp=datetime.utcnow()
-            )
-            self.db_session.add(ai_message)
-            self.db_session.commit()
+            user_message, ai_message = await self._save_exchange(user_message, response_content)
 
             return {
                 "user_message": user_message,
                 "ai_message": ai_message,
-                "category": category
+                "category": category,
+                "conversation_id": conversation_id
             }
 
+        except ProviderUnavailable:
+            await rollback(self.db_session)
+            raise
         except Exception as e:
-            self.db_session.rollback()
-            raise Exception(f"Error processing message: {str(e)}")
\ No newline at end of file
+            await rollback(self.db_session)
+            raise Exception(f"Error processing message: {str(e)}")
+
+    async def process_batch(self, contents: List[str], conversation_id: Optional[int] = None) -> dict:
+        """Process many messages, sharing the classification, embedding and vector search calls.
+
+        Answers are generated with at most BATCH_CONCURRENCY in flight. Results keep
+        the input order, and a failed item reports its error without failing the batch.
+        """
+        received_at = datetime.utcnow()
+        # Batch traffic queues behind interactive chats at the provider schedulers
+        priority = request_priority.set(BATCH)
+        try:
+            return await self._process_batch(contents, conversation_id, received_at)
+        finally:
+            request_priority.reset(priority)
+
+    async def _process_batch(self, contents: List[str], conversation_id: Optional[int], received_at: datetime) -> dict:
+        classified = await self.classify_messages(contents)
+        categories = [category for category, _ in classified]
+        self.check_capacity(categories)
+        prepared = [None] * len(contents)
+        food = [i for i, category in enumerate(categories) if category == "food"]
+        if food:
+            for i, generation in zip(food, await self.prepare_food_queries([contents[i] for i in food])):
+                prepared[i] = generation
+        semaphore = asyncio.Semaphore(Config.BATCH_CONCURRENCY)
+
+        async def answer(i: int) -> str:
+            async with semaphore:
+                generation = prepared[i]
+                if isinstance(generation, Exception):
+                    raise generation
+                if categories[i] is None:
+                    raise ValueError("Message could not be classified")
+                if categories[i] == "weather":
+                    generation = await self.prepare_weather_query(contents[i])
+                elif generation is None:
+                    generation = Generation(answer=OTHER_REPLY)
+                return await generation.complete()
+
+        answers = await asyncio.gather(*(answer(i) for i in range(len(contents))), return_exceptions=True)
+        results, exchanges = [], []
+        for i, (content, category, response) in enumerate(zip(contents, categories, answers)):
+            if isinstance(response, Exception):
+                logger.warning("Batch item %d failed: %s", i, response)
+                results.append({"index": i, "category": category, "response": None, "error": str(response)})
+                continue
+            user_message = Message(
+                conversation_id=conversation_id,
+                is_ai=False,
+                content=content,
+                category=category,
+                category_source=classified[i][1],
+                timestamp=received_at
+            )
+            exchanges.append((user_message, response))
+            results.append({"index": i, "category": category, "response": response, "error": None})
+        try:
+            await self._save_exchanges(exchanges)
+        except Exception:
+            await rollback(self.db_session)
+            raise
+        return {"conversation_id": conversation_id, "results": results}
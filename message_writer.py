@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import time
+from typing import List
+from models import Message
+from db import SessionLocal
+from telemetry import span
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class MessageWriter:
+    """Write-behind queue that commits Message rows from many requests in one transaction"""
+
+    def __init__(self, batch_size: int = Config.MESSAGE_WRITE_BATCH_SIZE,
+                 interval: float = Config.MESSAGE_WRITE_INTERVAL):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue = asyncio.Queue()
+        self._task = None
+        self._batch = []  # taken off the queue but not yet handed to a write
+        self.stats = {"messages_written": 0, "batches_written": 0, "write_errors": 0}
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, *messages: Message):
+        for message in messages:
+            self._queue.put_nowait(message)
+
+    async def stop(self):
+        """Stop the background task and flush everything still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        batch, self._batch = self._batch, []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if batch:
+            await asyncio.to_thread(self._write, batch)
+
+    async def _run(self):
+        while True:
+            self._batch = [await self._queue.get()]
+            # Let other requests' messages accumulate for one interval, then take up to a batch
+            await asyncio.sleep(self.interval)
+            while len(self._batch) < self.batch_size and not self._queue.empty():
+                self._batch.append(self._queue.get_nowait())
+            batch, self._batch = self._batch, []
+            write = asyncio.ensure_future(asyncio.to_thread(self._write, batch))
+            try:
+                await asyncio.shield(write)
+            except asyncio.CancelledError:
+                # Shutting down mid-write: let the in-flight batch finish before stop() drains the rest
+                await write
+                raise
+
+    def _write(self, batch: List[Message]):
+        for attempt in range(Config.MESSAGE_WRITE_RETRIES + 1):
+            db = SessionLocal()
+            try:
+                with span("db_commit_batch"):
+                    db.add_all(batch)
+                    db.commit()
+                self.stats["messages_written"] += len(batch)
+                self.stats["batches_written"] += 1
+                return
+            except Exception as e:
+                db.rollback()
+                self.stats["write_errors"] += 1
+                logger.warning("Error writing %d messages (attempt %d): %s", len(batch), attempt + 1, e)
+            finally:
+                db.close()
+            time.sleep(Config.MESSAGE_WRITE_RETRY_BACKOFF * (attempt + 1))
+        logger.error("Dropped %d messages after %d failed writes", len(batch), Config.MESSAGE_WRITE_RETRIES + 1)
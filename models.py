@@ -1,17 +1,35 @@
-from sqlalchemy import Column, Integer, Boolean, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, Boolean, String, DateTime, ForeignKey, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship
 from datetime import datetime
 
 Base = declarative_base()
 
+class Conversation(Base):
+    __tablename__ = 'conversations'
+
+    id = Column(Integer, primary_key=True, index=True)
+    title = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class Message(Base):
     __tablename__ = 'messages'
+    __table_args__ = (
+        # Keyset pagination over a conversation's history: WHERE conversation_id = ? AND (timestamp, id) < (?, ?)
+        Index('ix_messages_conversation_timestamp_id', 'conversation_id', 'timestamp', 'id'),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
+    conversation_id = Column(Integer, ForeignKey('conversations.id'), nullable=True)
+    reply_to_id = Column(Integer, ForeignKey('messages.id'), nullable=True)  # user message an AI reply answers
     is_ai = Column(Boolean, default=False)
     content = Column(String)
+    category = Column(String, nullable=True)  # food / weather / other, set on user messages
+    category_source = Column(String, nullable=True)  # local / llm: who assigned the category
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+    reply_to = relationship('Message', remote_side=[id])
+
 class Document(Base):
     __tablename__ = 'documents'
     
@@ -27,4 +45,24 @@ class DocumentPage(Base):
     document_id = Column(Integer, ForeignKey('documents.id'))
     page_number = Column(Integer)
     content = Column(Text)  # Using Text for potentially large content
-    is_processed = Column(Boolean, default=False)
\ No newline at end of file
+    is_processed = Column(Boolean, default=False)
+
+class IngestionJob(Base):
+    __tablename__ = 'ingestion_jobs'
+
+    id = Column(String, primary_key=True)  # uuid4 hex
+    document_id = Column(Integer, ForeignKey('documents.id'), nullable=True)  # set once the document is committed
+    title = Column(String)
+    file_path = Column(String)
+    status = Column(String, default='queued')  # queued / running / succeeded / failed / cancelled
+    stage = Column(String, nullable=True)  # parsing / embedding / committing
+    pages_total = Column(Integer, default=0)
+    pages_parsed = Column(Integer, default=0)
+    chunks_total = Column(Integer, default=0)
+    chunks_embedded = Column(Integer, default=0)
+    committed = Column(Boolean, default=False)
+    cancel_requested = Column(Boolean, default=False)
+    worker_pid = Column(Integer, nullable=True)  # app process whose queue holds the job
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
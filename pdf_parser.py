@@ -0,0 +1,45 @@
+import asyncio
+import multiprocessing
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import List, Tuple
+from pypdf import PdfReader
+from telemetry import span
+from config import Config
+
+# Kept free of heavy imports: worker processes are spawned and import only this module
+
+def create_parse_pool() -> ProcessPoolExecutor:
+    """Process pool for PDF parsing (spawned, not forked, since the server process runs threads)"""
+    return ProcessPoolExecutor(
+        max_workers=Config.PDF_PARSE_WORKERS,
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+def count_pages(file_path: str) -> int:
+    return len(PdfReader(file_path).pages)
+
+def parse_page_range(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Extract text for pages [start, end) as (0-based page index, text) pairs"""
+    reader = PdfReader(file_path)
+    return [(index, reader.pages[index].extract_text() or "") for index in range(start, end)]
+
+async def iter_page_ranges(file_path: str, pool: Executor, page_count: int):
+    """Yield (page index, text) lists in page order, parsing ranges in the pool a bounded distance ahead"""
+    loop = asyncio.get_running_loop()
+    step = Config.PDF_PAGES_PER_TASK
+    ranges = deque((start, min(start + step, page_count)) for start in range(0, page_count, step))
+    in_flight = deque()
+    try:
+        while ranges or in_flight:
+            # Bounded read-ahead keeps memory flat regardless of document size
+            while ranges and len(in_flight) < Config.PDF_PARSE_READ_AHEAD:
+                start, end = ranges.popleft()
+                in_flight.append(loop.run_in_executor(pool, parse_page_range, file_path, start, end))
+            # Time spent waiting on the pool, i.e. how far parsing lags behind embedding
+            with span("ingest.parse_wait"):
+                parsed = await in_flight.popleft()
+            yield parsed
+    finally:
+        for future in in_flight:
+            future.cancel()
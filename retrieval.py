@@ -0,0 +1,36 @@
+from typing import Any, Dict, List
+from config import Config
+
+# Helpers over Chroma-shaped results for a single query: {"ids": [[...]], "documents": [[...]], "metadatas": [[...]]}
+
+def top_results(results: Dict[str, Any], n_results: int) -> Dict[str, List[List[Any]]]:
+    keys = [key for key in ("ids", "documents", "metadatas", "distances", "scores") if key in results]
+    return {key: [results[key][0][:n_results]] for key in keys}
+
+def result_row(results: Dict[str, Any], row: int) -> Dict[str, List[List[Any]]]:
+    """One query's results out of a multi-query response"""
+    keys = [key for key in ("ids", "documents", "metadatas", "distances", "scores") if results.get(key) is not None]
+    return {key: [results[key][row]] for key in keys}
+
+def relevance_scores(results: Dict[str, Any]) -> List[float]:
+    """Higher-is-better relevance per result: BM25/fused scores, else 1 / (1 + distance), else by rank"""
+    if "scores" in results:
+        return [float(score) for score in results["scores"][0]]
+    if "distances" in results:
+        return [1.0 / (1.0 + float(distance)) for distance in results["distances"][0]]
+    return [1.0 / (rank + 1) for rank in range(len(results["ids"][0]))]
+
+def reciprocal_rank_fusion(result_sets: List[Dict[str, Any]], n_results: int, k: int = Config.RRF_K) -> Dict[str, List[List[Any]]]:
+    """Merge rankings by summing 1 / (k + rank); needs only ranks, so BM25 scores and distances never mix"""
+    scores, entries = {}, {}
+    for results in result_sets:
+        for rank, item_id in enumerate(results["ids"][0]):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank + 1)
+            entries.setdefault(item_id, (results["documents"][0][rank], results["metadatas"][0][rank]))
+    ranked = sorted(scores, key=scores.get, reverse=True)[:n_results]
+    return {
+        "ids": [ranked],
+        "documents": [[entries[item_id][0] for item_id in ranked]],
+        "metadatas": [[entries[item_id][1] for item_id in ranked]],
+        "scores": [[scores[item_id] for item_id in ranked]]
+    }
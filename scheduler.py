@@ -0,0 +1,286 @@
+import asyncio
+import functools
+import heapq
+import inspect
+import itertools
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Optional
+import httpx
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first: chats ahead of /messages/batch, both ahead of document ingestion
+INTERACTIVE, BATCH, INGEST = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch", INGEST: "ingest"}
+
+# Priority of upstream calls made in the current context (set by batch requests and ingestion jobs)
+request_priority: ContextVar[int] = ContextVar("request_priority", default=INTERACTIVE)
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+class ProviderUnavailable(Exception):
+    """A provider can't take the call now: its queue is full (503) or it kept rate limiting us (429)"""
+
+    def __init__(self, provider: str, status_code: int, retry_after: float, detail: str):
+        super().__init__(detail)
+        self.provider = provider
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+def _status_code(error: Exception) -> Optional[int]:
+    return getattr(error, "status_code", None)
+
+def _connection_errors() -> tuple:
+    # Imported here so importing this module doesn't load both SDKs; both are loaded once a client exists
+    import groq
+    import openai
+    return openai.APIConnectionError, groq.APIConnectionError, httpx.TransportError
+
+def is_retryable(error: Exception) -> bool:
+    return isinstance(error, _connection_errors()) or _status_code(error) in RETRYABLE_STATUS
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the provider asked us to wait (Retry-After / retry-after-ms headers), if it said"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+def retry_delay(error: Exception, attempt: int, base: float = Config.PROVIDER_RETRY_BACKOFF) -> float:
+    """Retry-After when given, else exponential backoff with jitter (half fixed, half random)"""
+    requested = retry_after(error)
+    if requested is not None:
+        return requested + random.uniform(0, base)
+    cap = min(Config.PROVIDER_RETRY_MAX_DELAY, base * 2 ** attempt)
+    return cap / 2 + random.uniform(0, cap / 2)
+
+def request_tokens(kwargs: dict) -> int:
+    """Rough token cost of a chat or embedding call, for the tokens-per-minute bucket"""
+    chars = 0
+    for message in kwargs.get("messages") or []:
+        chars += len(str(message.get("content") or ""))
+    payload = kwargs.get("input")
+    if payload is not None:
+        chars += len(payload) if isinstance(payload, str) else sum(len(str(item)) for item in payload)
+    return chars // Config.CONTEXT_CHARS_PER_TOKEN + int(kwargs.get("max_tokens") or 0)
+
+class TokenBucket:
+    """Refills per_minute units a minute, holding at most a minute's worth; 0 means unlimited"""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount is available (anything over capacity waits for a full bucket)"""
+        if self.rate <= 0:
+            return 0.0
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float):
+        if self.rate > 0:
+            self.level -= min(amount, self.capacity)
+
+class ProviderScheduler:
+    """Admission control for one provider: bounded concurrency, a priority queue, rate limits and retries"""
+
+    def __init__(self, provider: str, max_concurrency: int, requests_per_minute: float = 0,
+                 tokens_per_minute: float = 0, max_queue: int = Config.PROVIDER_MAX_QUEUE,
+                 queue_timeout: float = Config.PROVIDER_QUEUE_TIMEOUT):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.in_flight = 0
+        self.paused_until = 0.0  # set by a 429 so every caller backs off, not just the one that got it
+        self.closed = False
+        self._waiters = []  # heap of [priority, sequence, future]
+        self._sequence = itertools.count()
+        self.stats = {"calls": 0, "queued": 0, "rejected": 0, "queue_timeouts": 0,
+                      "retries": 0, "rate_limited": 0, "failures": 0}
+
+    def queue_depth(self) -> dict:
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, _ in self._waiters:
+            depth[PRIORITY_NAMES.get(priority, str(priority))] += 1
+        return depth
+
+    def saturated(self) -> bool:
+        # Ingestion waiters don't count: they are served after every other waiter anyway
+        return sum(1 for priority, _, _ in self._waiters if priority < INGEST) >= self.max_queue
+
+    def _busy(self, detail: str) -> ProviderUnavailable:
+        # A rough hint: one queue's worth of calls at about a second each
+        hint = max(1.0, self.paused_until - time.monotonic(), len(self._waiters) / max(self.max_concurrency, 1))
+        return ProviderUnavailable(self.provider, 503, hint, detail)
+
+    def check_capacity(self):
+        """Raise ProviderUnavailable (503) when there's no room to queue another call"""
+        if self.saturated():
+            self.stats["rejected"] += 1
+            raise self._busy(f"{self.provider} is overloaded, try again shortly")
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, priority: int, tokens: int = 0):
+        """Take a concurrency slot (highest priority first), then wait for rate-limit budget.
+
+        Ingestion (background) calls are never rejected and wait as long as it takes
+        behind the other traffic; everything else gets a 503 when the queue is full or
+        the wait exceeds queue_timeout.
+        """
+        if self.closed:
+            raise self._busy(f"{self.provider} scheduler is shut down")
+        background = priority >= INGEST
+        if self.in_flight >= self.max_concurrency or self._waiters:
+            if not background:
+                self.check_capacity()
+            self.stats["queued"] += 1
+            future = asyncio.get_running_loop().create_future()
+            entry = [priority, next(self._sequence), future]
+            heapq.heappush(self._waiters, entry)
+            try:
+                await asyncio.wait_for(future, None if background else self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._forget(entry)
+                self.stats["queue_timeouts"] += 1
+                raise self._busy(f"Timed out waiting for {self.provider}")
+            except asyncio.CancelledError:
+                self._forget(entry)
+                if future.done() and not future.cancelled():
+                    self.release()  # the slot was handed over just as we gave up
+                raise
+        else:
+            self.in_flight += 1
+        try:
+            while True:
+                now = time.monotonic()
+                wait = max(self.paused_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+        except BaseException:
+            self.release()
+            raise
+        self.requests.take(1)
+        self.tokens.take(tokens)
+
+    def _forget(self, entry: list):
+        if entry in self._waiters:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+
+    def release(self):
+        self.in_flight -= 1
+        # Hand freed slots straight to the highest-priority waiters
+        while self._waiters and self.in_flight < self.max_concurrency:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+    def close(self):
+        """Fail every waiter (ingestion threads may be blocked in hold_from_thread) and refuse new calls"""
+        self.closed = True
+        waiters, self._waiters = self._waiters, []
+        for _, _, future in waiters:
+            if not future.done():
+                future.set_exception(self._busy(f"{self.provider} scheduler is shut down"))
+
+    def _note_failure(self, error: Exception, delay: float):
+        if _status_code(error) == 429:
+            self.stats["rate_limited"] += 1
+            self.pause(delay)
+
+    async def run(self, call: Callable[[], Awaitable[Any]], tokens: int = 0, priority: Optional[int] = None) -> Any:
+        """Run call() under the limits, retrying retryable failures with backoff"""
+        priority = request_priority.get() if priority is None else priority
+        for attempt in range(Config.PROVIDER_MAX_RETRIES + 1):
+            await self.acquire(priority, tokens)
+            self.stats["calls"] += 1
+            try:
+                return await call()
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                delay = retry_delay(e, attempt)
+                self._note_failure(e, delay)
+                if attempt == Config.PROVIDER_MAX_RETRIES or delay > Config.PROVIDER_RETRY_MAX_DELAY:
+                    self.stats["failures"] += 1
+                    status = 429 if _status_code(e) == 429 else 503
+                    raise ProviderUnavailable(self.provider, status, delay, f"{self.provider} is unavailable: {e}") from e
+                self.stats["retries"] += 1
+                logger.warning("%s call failed (%s), retry %d in %.1fs", self.provider, e, attempt + 1, delay)
+            finally:
+                self.release()
+            await asyncio.sleep(delay)
+
+    @contextmanager
+    def hold_from_thread(self, loop: asyncio.AbstractEventLoop, priority: int, tokens: int = 0):
+        """acquire/release for calls made from a worker thread; blocks the thread, not the event loop"""
+        asyncio.run_coroutine_threadsafe(self.acquire(priority, tokens), loop).result()
+        try:
+            yield
+        except Exception as e:
+            if is_retryable(e):
+                loop.call_soon_threadsafe(self._note_failure, e, retry_delay(e, 0))
+            raise
+        finally:
+            loop.call_soon_threadsafe(self.release)
+
+    def get_stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.queue_depth(),
+            "paused_for": max(0.0, self.paused_until - time.monotonic()),
+            **self.stats
+        }
+
+class ScheduledClient:
+    """Proxy over a provider SDK client that runs its async methods through a ProviderScheduler.
+
+    Streaming calls hold their slot until the stream has started, not until it ends.
+    """
+
+    def __init__(self, target, scheduler: ProviderScheduler):
+        self._target = target
+        self._scheduler = scheduler
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        if name.startswith("_") or name in ("close", "with_options", "with_raw_response", "with_streaming_response"):
+            return attr
+        if inspect.iscoroutinefunction(inspect.unwrap(attr)):
+            return functools.partial(self._call, attr)
+        if callable(attr) or isinstance(attr, (str, bytes, int, float, bool, type(None), dict, list, tuple)):
+            return attr
+        return ScheduledClient(attr, self._scheduler)
+
+    async def _call(self, method, *args, **kwargs):
+        return await self._scheduler.run(lambda: method(*args, **kwargs), request_tokens(kwargs))
@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+from config import Config
+
+class SemanticCache:
+    """LRU/TTL answer cache keyed on query embeddings, matched by cosine distance.
+
+    Vectors live in rows of one preallocated matrix; rows freed by eviction are
+    reused, so a store or an eviction never rebuilds it. TTL is checked on the
+    matched entry only: expired entries that never match wait for LRU eviction.
+    """
+
+    def __init__(
+        self,
+        max_distance: float = Config.SEMANTIC_CACHE_MAX_DISTANCE,
+        ttl: float = Config.SEMANTIC_CACHE_TTL,
+        max_bytes: int = Config.SEMANTIC_CACHE_MAX_BYTES
+    ):
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.generation = 0  # bumped on every invalidation
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        self._entries = OrderedDict()  # row -> (answer, stored_at, size), in LRU order
+        self._size = 0
+        self._matrix = None  # rows of unit vectors, grown by doubling
+        self._used = None  # which rows hold an entry
+        self._rows = 0  # rows ever used; free rows below this are in _free
+        self._free = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, row: int):
+        answer, stored_at, size = self._entries.pop(row)
+        self._size -= size
+        self._used[row] = False
+        self._free.append(row)
+
+    def _allocate(self, dimensions: int) -> int:
+        if self._free:
+            return self._free.pop()
+        if self._matrix is None:
+            self._matrix = np.zeros((64, dimensions), dtype=np.float32)
+            self._used = np.zeros(64, dtype=bool)
+        elif self._rows == len(self._matrix):
+            self._matrix = np.concatenate([self._matrix, np.zeros_like(self._matrix)])
+            self._used = np.concatenate([self._used, np.zeros_like(self._used)])
+        self._rows += 1
+        return self._rows - 1
+
+    def lookup(self, embedding: List[float]) -> Optional[str]:
+        """Return the cached answer for the nearest stored query within max_distance"""
+        query = self._normalize(embedding)
+        with self._lock:
+            if not self._entries:
+                self.stats["misses"] += 1
+                return None
+            similarities = self._matrix[:self._rows] @ query
+            similarities[~self._used[:self._rows]] = -np.inf
+            now = time.monotonic()
+            while True:
+                row = int(np.argmax(similarities))
+                if not self._used[row] or 1.0 - float(similarities[row]) > self.max_distance:
+                    self.stats["misses"] += 1
+                    return None
+                if now - self._entries[row][1] <= self.ttl:
+                    break
+                # Expired: drop it and try the next nearest
+                self._remove(row)
+                self.stats["evictions"] += 1
+                similarities[row] = -np.inf
+            self._entries.move_to_end(row)
+            self.stats["hits"] += 1
+            return self._entries[row][0]
+
+    def store(self, embedding: List[float], answer: str, generation: int):
+        """Cache an answer; dropped if the collection changed since `generation` was read"""
+        vector = self._normalize(embedding)
+        size = vector.nbytes + len(answer.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            while self._entries and self._size + size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats["evictions"] += 1
+            row = self._allocate(len(vector))
+            self._matrix[row] = vector
+            self._used[row] = True
+            self._entries[row] = (answer, time.monotonic(), size)
+            self._size += size
+
+    def invalidate(self):
+        """Drop every cached answer, e.g. after the source collection changed"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            if self._used is not None:
+                self._used[:] = False
+            self._free = list(range(self._rows - 1, -1, -1))
+            self.generation += 1
+            self.stats["invalidations"] += 1
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries), "bytes": self._size}
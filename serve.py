@@ -0,0 +1,98 @@
+"""Multi-worker deployment: one Chroma server owns the vector store, several app workers share it.
+
+Usage:
+    python serve.py --workers 4 --port 8000
+    python serve.py --workers 4 --chroma-url http://10.0.0.5:8001   # use an already running Chroma server
+
+Opening a PersistentClient on the same CHROMA_DB_PATH from several workers is
+unsafe for concurrent writes and loads the store once per process. Here a single
+Chroma server (chroma run) owns CHROMA_DB_PATH and serves the workers over
+localhost, each worker keeping one pooled HTTP client. Writes made by one
+worker's ingestion reach the others within CHROMA_SYNC_INTERVAL, when they drop
+their BM25 index and semantic cache for the changed collection.
+
+Interrupted ingestion jobs are failed once here, before the workers start.
+Afterwards a worker starting up (uvicorn restarting a crashed one) only fails
+the jobs of worker processes that have exited.
+"""
+import argparse
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+import httpx
+from config import Config
+from db import migrate_sync
+from ingestion_jobs import fail_interrupted_jobs
+from telemetry import configure_logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+def start_chroma_server(host: str, port: int) -> subprocess.Popen:
+    path = Config.CHROMADB_PATH or "./chroma_db"
+    os.makedirs(path, exist_ok=True)
+    argv = [sys.executable, "-m", "chromadb.cli.cli", "run", "--path", path, "--host", host, "--port", str(port),
+            "--log-path", os.path.join(path, "chroma_server.log")]
+    return subprocess.Popen(argv)
+
+def wait_for_chroma(url: str, process: Optional[subprocess.Popen] = None, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Chroma server exited with {process.returncode}")
+        try:
+            if httpx.get(url + "/api/v1/heartbeat", timeout=1).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Chroma server at {url} did not answer within {timeout}s")
+
+def stop(process: Optional[subprocess.Popen], timeout: float = 30):
+    if process is not None and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="app worker processes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--chroma-port", type=int, default=8001, help="port of the Chroma server started here")
+    parser.add_argument("--chroma-url", default=Config.CHROMA_SERVER_URL,
+                        help="use this running Chroma server instead of starting one")
+    args = parser.parse_args()
+    configure_logging()
+
+    migrate_sync()
+    fail_interrupted_jobs()
+
+    chroma = None
+    chroma_url = args.chroma_url
+    if not chroma_url:
+        chroma_url = f"http://127.0.0.1:{args.chroma_port}"
+        chroma = start_chroma_server("127.0.0.1", args.chroma_port)
+    app = None
+    try:
+        wait_for_chroma(chroma_url, chroma)
+        logger.info("Chroma server ready at %s, starting %d workers", chroma_url, args.workers)
+        env = dict(os.environ, CHROMA_SERVER_URL=chroma_url, INGEST_RECOVER_JOBS="false")
+        app = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", args.host,
+                                "--port", str(args.port), "--workers", str(args.workers)], env=env)
+        # Stop the workers (then the Chroma server) on SIGTERM as well as Ctrl+C
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        app.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop(app)
+        stop(chroma)
+
+if __name__ == "__main__":
+    main()
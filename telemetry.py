@@ -0,0 +1,179 @@
+import bisect
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def configure_logging():
+    logging.basicConfig(
+        level=Config.LOG_LEVEL,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Histogram:
+    """Cumulative-bucket histogram rendered in the Prometheus text format"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...], buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': le})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {values[-1]!r}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+STAGE_SECONDS = Histogram(
+    "chat_stage_duration_seconds",
+    "Time spent in each processing stage",
+    ("stage", "outcome")
+)
+REQUEST_SECONDS = Histogram(
+    "chat_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ("method", "route", "status")
+)
+FIRST_TOKEN_SECONDS = Histogram(
+    "chat_generation_first_token_seconds",
+    "Time from sending a streamed completion request to its first token",
+    ("provider",)
+)
+CONTEXT_TOKENS = Histogram(
+    "chat_context_tokens",
+    "Estimated prompt context tokens per food query: sent, and saved by merging, deduplication and the budget",
+    ("kind",),
+    buckets=(0, 100, 250, 500, 1000, 2000, 4000, 8000)
+)
+
+# Callables returning {(metric name, labels tuple): value}, evaluated on every scrape
+_collectors: List[Callable[[], Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float]]] = []
+
+def register_collector(collector):
+    _collectors.append(collector)
+
+def unregister_collector(collector):
+    if collector in _collectors:
+        _collectors.remove(collector)
+
+def stats_gauges(component: str, stats: dict) -> Dict[Tuple[str, tuple], float]:
+    """Expose an existing stats dict's numeric values as chat_component_stat gauges"""
+    return {
+        ("chat_component_stat", (("component", component), ("stat", name))): value
+        for name, value in stats.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+
+def render_metrics() -> str:
+    lines = []
+    for histogram in (STAGE_SECONDS, REQUEST_SECONDS, FIRST_TOKEN_SECONDS, CONTEXT_TOKENS):
+        lines.extend(histogram.render())
+    samples = {}
+    for collector in _collectors:
+        try:
+            samples.update(collector())
+        except Exception:
+            logger.exception("Metrics collector failed")
+    for name in sorted({name for name, _ in samples}):
+        lines.append(f"# TYPE {name} gauge")
+        for (sample_name, labels), value in sorted(samples.items()):
+            if sample_name == name:
+                lines.append(f"{name}{_format_labels(dict(labels))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+# Trace context (W3C traceparent: version-traceid-spanid-flags)
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_current_span: ContextVar[Optional[Tuple[str, str]]] = ContextVar("current_span", default=None)
+
+def _new_id(size: int) -> str:
+    return os.urandom(size).hex()
+
+def start_trace(traceparent: Optional[str]):
+    """Enter a request's trace: continue the caller's trace id, or start a new one.
+
+    Returns (token, traceparent of the request span) for the response header.
+    """
+    match = _TRACEPARENT_RE.match((traceparent or "").strip().lower())
+    trace_id = match.group(1) if match else _new_id(16)
+    span_id = _new_id(8)
+    token = _current_span.set((trace_id, span_id))
+    return token, f"00-{trace_id}-{span_id}-01"
+
+def end_trace(token):
+    _current_span.reset(token)
+
+def current_traceparent() -> Optional[str]:
+    """traceparent for an outgoing call made inside the current span, if there is a trace"""
+    current = _current_span.get()
+    return f"00-{current[0]}-{current[1]}-01" if current else None
+
+@contextmanager
+def span(stage: str):
+    """Time a stage into chat_stage_duration_seconds; inside a trace it is also logged as a child span"""
+    parent = _current_span.get()
+    span_id = _new_id(8) if parent else None
+    token = _current_span.set((parent[0], span_id)) if parent else None
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        STAGE_SECONDS.observe(duration, stage=stage, outcome=outcome)
+        if token is not None:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                pass  # an async generator closed from another context
+        if parent:
+            logger.info("span stage=%s outcome=%s trace_id=%s span_id=%s parent_id=%s duration_ms=%.1f",
+                        stage, outcome, parent[0], span_id, parent[1], duration * 1000)
+
+def sample_payload() -> bool:
+    """Whether to log full prompts/chunks/responses for this request (DEBUG_PAYLOAD_SAMPLE_RATE)"""
+    return Config.DEBUG_PAYLOAD_SAMPLE_RATE > 0 and random.random() < Config.DEBUG_PAYLOAD_SAMPLE_RATE
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+from database.chroma_client import IMPORT_LOCK
+from telemetry import span
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class WarmUp:
+    """Startup warm-up: open Chroma and load the search indexes, create the provider clients and
+    pre-connect to them, and import the ingestion dependencies, so first requests don't pay for it.
+
+    Only the Chroma step gates readiness; the others just make the first call faster.
+    """
+
+    def __init__(self, clients):
+        self.clients = clients
+        self.steps: Dict[str, dict] = {
+            name: {"status": "pending", "seconds": None, "error": None}
+            for name in ("chroma", "providers", "ingestion")
+        }
+        self.started = None
+        self.finished = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> asyncio.Task:
+        self.started = time.perf_counter()
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    @property
+    def ready(self) -> bool:
+        return self.finished is not None and self.steps["chroma"]["status"] == "ok"
+
+    async def run(self):
+        with span("startup.warm_up"):
+            # One step at a time: their imports are serialized by IMPORT_LOCK anyway
+            await self._step("chroma", self._warm_chroma)
+            await self._step("providers", self._warm_providers)
+            await self._step("ingestion", self._warm_ingestion)
+        self.finished = time.perf_counter()
+        logger.info("Warm-up finished in %.2fs: %s", self.finished - self.started,
+                    ", ".join(f"{name}={step['status']}" for name, step in self.steps.items()))
+
+    async def _step(self, name: str, warm):
+        step = self.steps[name]
+        step["status"] = "running"
+        started = time.perf_counter()
+        try:
+            await warm()
+            step["status"] = "ok"
+        except Exception as e:
+            logger.warning("Warm-up step %s failed: %s", name, e)
+            step["status"], step["error"] = "failed", str(e)
+        finally:
+            step["seconds"] = round(time.perf_counter() - started, 3)
+
+    async def _warm_chroma(self):
+        def warm():
+            chroma_db = self.clients.chroma_db
+            chroma_db.get_collection("document_pages")
+            chroma_db.get_backend("document_chunks").warm()
+            if Config.HYBRID_SEARCH:
+                chroma_db.get_lexical_index("document_chunks")
+        await asyncio.to_thread(warm)
+
+    async def _warm_providers(self):
+        # Creating the clients imports both SDKs; do it off the event loop
+        await asyncio.to_thread(lambda: (self.clients.openai_client, self.clients.groq_client))
+        pools = {"openai": self.clients.openai_http, "groq": self.clients.groq_http}
+        # Any response will do: the point is a pooled keep-alive connection (DNS, TCP and TLS done)
+        await asyncio.gather(*(
+            pools[provider].head(url) for provider, url in self.clients.provider_urls.items() if provider in pools
+        ))
+
+    async def _warm_ingestion(self):
+        def warm():
+            with IMPORT_LOCK:
+                from langchain.text_splitter import RecursiveCharacterTextSplitter  # noqa: F401
+                from langchain_core.documents import Document  # noqa: F401
+        await asyncio.to_thread(warm)
+
+    def get_status(self) -> dict:
+        return {"ready": self.ready, "steps": self.steps}
@@ -1,42 +1,109 @@
-import requests
+import asyncio
+import logging
+import time
+import httpx
+from typing import Dict, Optional
+from coalescing import SingleFlight
+from telemetry import span
 from config import Config
 import xml.etree.ElementTree as ET
 
-def get_current_weather():
-    """Fetch current weather data for configured location"""
-    try:
-        params = {
-            'key': Config.WEATHER_API_KEY,
-            'q': Config.WEATHER_LOCATION,
-        }
-        
-        response = requests.get(Config.WEATHER_API_URL, params=params)
-        response.raise_for_status()
-        
-        # Parse XML response
-        root = ET.fromstring(response.content)
-        
-        # Extract weather data from XML
-        current = root.find('current')
-        weather_data = {
-            'current': {
-                'temp_c': float(current.find('temp_c').text),
-                'temp_f': float(current.find('temp_f').text),
-                'condition': {
-                    'text': current.find('condition/text').text
-                },
-                'humidity': int(current.find('humidity').text),
-                'wind_kph': float(current.find('wind_kph').text)
-            }
+logger = logging.getLogger(__name__)
+
+def parse_weather(content: bytes) -> dict:
+    """Parse the weather API's XML response"""
+    root = ET.fromstring(content)
+
+    # Extract weather data from XML
+    current = root.find('current')
+    return {
+        'current': {
+            'temp_c': float(current.find('temp_c').text),
+            'temp_f': float(current.find('temp_f').text),
+            'condition': {
+                'text': current.find('condition/text').text
+            },
+            'humidity': int(current.find('humidity').text),
+            'wind_kph': float(current.find('wind_kph').text)
         }
-        
+    }
+
+async def fetch_current_weather(http_client: httpx.AsyncClient, location: str) -> dict:
+    """Fetch current weather data for a location (raises on failure)"""
+    params = {
+        'key': Config.WEATHER_API_KEY,
+        'q': location,
+    }
+    response = await http_client.get(Config.WEATHER_API_URL, params=params)
+    response.raise_for_status()
+    return parse_weather(response.content)
+
+class WeatherProvider:
+    """Per-location TTL cache over the weather API with stale-while-revalidate"""
+
+    def __init__(
+        self,
+        http_client: httpx.AsyncClient,
+        default_ttl: float = Config.WEATHER_CACHE_TTL,
+        ttl_overrides: Optional[Dict[str, float]] = None,
+        max_stale: float = Config.WEATHER_CACHE_MAX_STALE,
+        flight: Optional[SingleFlight] = None
+    ):
+        self.http_client = http_client
+        self.default_ttl = default_ttl
+        self.ttl_overrides = Config.WEATHER_CACHE_TTL_OVERRIDES if ttl_overrides is None else ttl_overrides
+        self.max_stale = max_stale
+        self._cache = {}  # location -> (weather_data, fetched_at)
+        self.flight = flight or SingleFlight()  # one in-flight refresh per location
+        self.stats = {"fresh_hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0}
+
+    def ttl_for(self, location: str) -> float:
+        return self.ttl_overrides.get(location, self.default_ttl)
+
+    async def _fetch_and_store(self, location: str) -> dict:
+        self.stats["refreshes"] += 1
+        try:
+            with span("weather_fetch"):
+                weather_data = await fetch_current_weather(self.http_client, location)
+        except Exception as e:
+            self.stats["refresh_errors"] += 1
+            logger.warning("Error fetching weather data for %s: %s", location, e)
+            raise
+        self._cache[location] = (weather_data, time.monotonic())
         return weather_data
-        
-    except Exception as e:
-        print(f"Error fetching weather data: {str(e)}")
-        return None
-
-# Test the function
-result = get_current_weather()
-if result:
-    print("Parsed JSON:", result)
\ No newline at end of file
+
+    def _refresh(self, location: str) -> asyncio.Future:
+        """Start a refresh for a location, or join the one already running"""
+        return self.flight.start("weather", ("weather", location), lambda: self._fetch_and_store(location))
+
+    async def get(self, location: Optional[str] = None) -> Optional[dict]:
+        """Return current weather, serving the previous reading while a refresh runs"""
+        location = location or Config.WEATHER_LOCATION
+        entry = self._cache.get(location)
+        if entry is not None:
+            weather_data, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl_for(location):
+                self.stats["fresh_hits"] += 1
+                return weather_data
+            if age < self.ttl_for(location) + self.max_stale:
+                self.stats["stale_hits"] += 1
+                self._refresh(location)
+                return weather_data
+
+        # Nothing usable cached: wait for the shared refresh
+        self.stats["misses"] += 1
+        try:
+            return await asyncio.shield(self._refresh(location))
+        except Exception:
+            return None
+
+    def warm_up(self):
+        """Start background fetches for the configured locations without blocking startup"""
+        locations = {Config.WEATHER_LOCATION, *self.ttl_overrides.keys()}
+        for location in locations:
+            if location:
+                self._refresh(location)
+
+    def get_stats(self):
+        return {**self.stats, "locations": len(self._cache)}